@@ -0,0 +1,103 @@
+"""
+/api/v1 لتطبيق الموبايل (الفني): JSON خفيف بدل صفحات HTML.
+
+- auth: Authorization: Bearer <token> (POST /api/v1/auth/token بالهاتف + كلمة السر)
+- ?fields=id,points => بس هالحقول (projection)
+- ETag من data_versions (مثل صفحات الفني) => If-None-Match يرجع 304 بدون body
+- gzip إذا العميل يقبله والـ body أكبر من API_GZIP_MIN_BYTES (الرصيد ~50 byte ما يستاهل)
+- قوائم طويلة: ?limit=&cursor= (cursor = id آخر عنصر، keyset مو OFFSET)
+
+الـ routes نفسها بـ app.py، هنا الأدوات المشتركة.
+"""
+import gzip
+import json
+import os
+
+from flask import current_app, request
+
+API_GZIP_MIN_BYTES = int(os.getenv("API_GZIP_MIN_BYTES", "512"))
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# الحقول المسموحة بكل resource (وترتيبها بالـ JSON)
+ME_FIELDS = ("id", "name", "points")
+GIFT_FIELDS = ("id", "name", "points_required", "image", "thumb")
+REDEMPTION_FIELDS = ("id", "created_at", "gift_id", "gift_name", "points_spent", "status")
+
+
+class ApiError(Exception):
+    def __init__(self, status, code, message=""):
+        super().__init__(message or code)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def bearer_token():
+    auth = request.headers.get("Authorization", "")
+    scheme, _, token = auth.partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else ""
+
+
+def request_data():
+    """body JSON أو form (حتى الـ curl العادي يشتغل)."""
+    return request.get_json(silent=True) or request.form
+
+
+def fields(allowed):
+    """?fields=a,b => tuple بنفس ترتيب allowed، وبدونه كل الحقول."""
+    raw = request.args.get("fields", "").strip()
+    if not raw:
+        return allowed
+    wanted = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = wanted - set(allowed)
+    if unknown:
+        raise ApiError(400, "unknown_fields", "الحقول المسموحة: " + ",".join(allowed))
+    return tuple(f for f in allowed if f in wanted)
+
+
+def project(item, names):
+    return {name: item[name] for name in names}
+
+
+def page_args():
+    """(limit, cursor) من ?limit=&cursor=."""
+    try:
+        limit = int(request.args.get("limit", API_PAGE_SIZE))
+        cursor = request.args.get("cursor", "").strip()
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        raise ApiError(400, "bad_page", "limit و cursor لازم أرقام")
+    return max(1, min(limit, API_MAX_PAGE_SIZE)), cursor
+
+
+def json_response(payload, status=200, etag=None):
+    """
+    JSON مضغوط (بدون مسافات، والعربي UTF-8 مو \\uXXXX) + gzip + ETag.
+    الـ ETag weak: نفس القيمة للنسخة المضغوطة وغير المضغوطة.
+    """
+    if etag and request.if_none_match.contains_weak(etag):
+        resp = current_app.response_class(status=304)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        resp = current_app.response_class(body, status=status, mimetype="application/json")
+        if len(body) >= API_GZIP_MIN_BYTES and request.accept_encodings["gzip"]:
+            resp.set_data(gzip.compress(body, compresslevel=6, mtime=0))
+            resp.headers["Content-Encoding"] = "gzip"
+
+    if etag:
+        resp.set_etag(etag, weak=True)
+    resp.vary.add("Accept-Encoding")
+    resp.vary.add("Authorization")
+    # بيانات فني: التطبيق يخزن ويسأل كل مرة، والـ proxies لا
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def error_response(e):
+    return json_response({"error": e.code, "message": e.message}, status=e.status)
+
+
+def init_app(app):
+    app.register_error_handler(ApiError, error_response)
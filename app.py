@@ -1,25 +1,129 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+import json
+import hashlib
+import functools
+import tempfile
+import threading
+from flask import Flask, current_app, render_template, request, redirect, url_for, session, g, flash, jsonify, make_response, abort, stream_with_context
 from werkzeug.utils import secure_filename
 import db
+import api
+import assets
+import bulk_import
+import exports
+import images
+import metrics
+import page_cache
+import slow_queries
+import storage
 import mimetypes
-import requests
+import click
+from markupsafe import Markup
+from werkzeug.exceptions import RequestEntityTooLarge
 
 from dotenv import load_dotenv
 load_dotenv()
 
-# ✅ Supabase Storage (موجود عندك)
-# (نخليه موجود حتى ما نحذف شي، بس راح نعتمد REST تحت)
-from supabase import create_client
-from urllib.parse import urlparse
-
-app = Flask(__name__)
-app.secret_key = "change-this-secret"
+from urllib.parse import urljoin, urlparse
+from datetime import datetime, timedelta
 
 SITE_NAME = "مجمع فاضل البديري"
-UPLOAD_DIR = os.path.join(app.root_path, "static", "uploads")
+TECHS_PAGE_SIZE = 50
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# ✅ حد حجم الطلب (صور + CSV). Werkzeug يرفض قبل ما يقرا الـ body إذا Content-Length أكبر،
+# والملفات الكبيرة تنكتب على temp file (مو بالذاكرة) لحد ما نرفعها chunk chunk
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "16"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# bootstrap (migrations + super admin) مرة وحدة لكل deploy:
+# gunicorn.conf.py يسويه بالـ master ويحط APP_BOOTSTRAPPED=1 للـ workers.
+# بدونه (flask run) يصير بأول request، مو وقت الـ import.
+_bootstrapped = os.getenv("APP_BOOTSTRAPPED") == "1"
+_bootstrap_lock = threading.Lock()
+
+
+def _ensure_bootstrapped():
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    with _bootstrap_lock:
+        if not _bootstrapped:
+            bootstrap()
+
+
+class _AppSetup:
+    """
+    الـ routes / hooks / cli commands مال هذا الملف تنسجل هنا (نفس decorators مال Flask)،
+    و create_app() يطبقها على كل app ينبني.
+    مثل Blueprint بس أسماء الـ endpoints تبقى بدون prefix: url_for('admin_login') نفسه.
+    """
+    def __init__(self):
+        self._setup = []
+        # @routes.cli.command(...) مثل @app.cli.command(...)
+        self.cli = self
+
+    def _record(self, fn):
+        self._setup.append(fn)
+
+    def route(self, rule, **options):
+        def decorator(view):
+            self._record(lambda a: a.add_url_rule(rule, view.__name__, view, **options))
+            return view
+        return decorator
+
+    def get(self, rule, **options):
+        return self.route(rule, methods=["GET"], **options)
+
+    def post(self, rule, **options):
+        return self.route(rule, methods=["POST"], **options)
+
+    def delete(self, rule, **options):
+        return self.route(rule, methods=["DELETE"], **options)
+
+    def before_request(self, fn):
+        self._record(lambda a: a.before_request(fn))
+        return fn
+
+    def errorhandler(self, code_or_exception):
+        def decorator(fn):
+            self._record(lambda a: a.register_error_handler(code_or_exception, fn))
+            return fn
+        return decorator
+
+    def command(self, name):
+        def decorator(fn):
+            self._record(lambda a: a.cli.command(name)(fn))
+            return fn
+        return decorator
+
+    def init_app(self, flask_app):
+        for fn in self._setup:
+            fn(flask_app)
+
+
+routes = _AppSetup()
+
+
+def create_app():
+    """
+    ينشئ Flask app جديد: الإعدادات والـ extensions وكل الـ routes، بدون ما يلمس الـ DB.
+    كل نداء يرجع app مستقل (gunicorn يستخدم app اللي بآخر الملف).
+    """
+    flask_app = Flask(__name__)
+    flask_app.secret_key = "change-this-secret"
+    flask_app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+    metrics.init_app(flask_app)
+    slow_queries.init_app(flask_app)
+    api.init_app(flask_app)
+    db.init_app(flask_app)
+    assets.init_app(flask_app)
+    flask_app.before_request(_ensure_bootstrapped)
+    routes.init_app(flask_app)
+    return flask_app
+
+
 # =========================================================
 # ✅ إعدادات Supabase من Environment Variables
 # =========================================================
@@ -52,36 +156,43 @@ def supabase_upload_file(file_storage, folder="gifts"):
     object_path = f"{folder}/{filename}"
 
     content_type = file_storage.mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream"
-    data = file_storage.read()  # bytes
-
-    url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{object_path}"
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-        "apikey": SUPABASE_SERVICE_ROLE_KEY,
-        "Content-Type": content_type,
-        "x-upsert": "true",
-    }
+    file_storage.stream.seek(0)
+
+    # نمرر الـ stream نفسه => requests يرفعه chunk chunk بدل bytes كاملة بالذاكرة
+    return supabase_upload_bytes(file_storage.stream, object_path, content_type)
 
-    r = requests.post(url, headers=headers, data=data)
-    if r.status_code not in (200, 201):
-        raise Exception(f"Supabase upload failed: {r.status_code} {r.text}")
 
-    return object_path  # نخزنه داخل image_filename
+def supabase_upload_bytes(data, object_path, content_type):
+    # session مشتركة + timeout + retry (storage.StorageClient)
+    # data = bytes أو file object (يترفع stream)
+    return storage_client.upload(object_path, data, content_type)  # نخزنه داخل image_filename
 
 
 def supabase_delete_file(object_path):
     """
     ✅ REST Delete
-    يحذف ملف من Storage حسب path المخزن بالـ DB
+    يحذف ملف من Storage حسب path المخزن بالـ DB (يرمي StorageError إذا فشل)
     """
     if not object_path:
         return
-    url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{object_path}"
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-        "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    }
-    requests.delete(url, headers=headers)
+    storage_client.delete(object_path)
+
+
+storage_client = storage.StorageClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, SUPABASE_BUCKET)
+
+
+@routes.before_request
+def _start_storage_worker():
+    # worker واحد لكل process يفرغ طابور storage_jobs (STORAGE_WORKER=0 يطفيه)
+    if _use_supabase_storage() and os.getenv("STORAGE_WORKER", "1") == "1":
+        storage.ensure_worker(storage_client)
+
+
+@routes.errorhandler(RequestEntityTooLarge)
+def _upload_too_large(e):
+    # ✅ يوصل هنا قبل ما ينقرا الملف (أو أول ما يعبر الحد إذا ماكو Content-Length)
+    flash(f"الملف كبير، الحد الأقصى {MAX_UPLOAD_MB} MB", "err")
+    return redirect(request.referrer or url_for("admin_dashboard"))
 
 
 # ---------- Helpers ----------
@@ -101,6 +212,61 @@ def current_user_id():
     return session.get("user_id")
 
 
+# =========================================================
+# ✅ ETag / 304 لصفحات الفني حسب data_versions
+# =========================================================
+_etag_salt = None
+
+
+def _deploy_salt():
+    # يتغير مع الـ templates / static / إعدادات Supabase => deploy جديد ما يرجع 304 على HTML قديم
+    global _etag_salt
+    if _etag_salt is None:
+        h = hashlib.sha256(SUPABASE_URL.encode())
+        for name in sorted(current_app.jinja_env.list_templates()):
+            h.update(name.encode())
+            h.update(current_app.jinja_env.loader.get_source(current_app.jinja_env, name)[0].encode())
+        h.update(json.dumps(current_app.extensions["assets"]["manifest"], sort_keys=True).encode())
+        _etag_salt = h.hexdigest()
+    return _etag_salt
+
+
+def versioned_page(*tables):
+    """
+    صفحة الفني تعتمد على هالجداول + بيانات الفني نفسه (tech_scope).
+    ETag = hash(الصفحة + الفني + versions) => If-None-Match يرجع 304 بـ query وحدة
+    قبل الـ queries الثقيلة والـ template.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # flash مو داخل الـ ETag => نرندر عادي
+            if not user_required() or "_flashes" in session:
+                return view(*args, **kwargs)
+
+            uid = current_user_id()
+            versions = db.get_versions([*tables, db.tech_scope(uid)])
+            etag = hashlib.sha256(
+                f"{_deploy_salt()}|{request.endpoint}|{uid}|{sorted(versions.items())}".encode()
+            ).hexdigest()[:32]
+
+            if etag in request.if_none_match:
+                resp = current_app.response_class(status=304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            # المتصفح يخزن بس يسأل كل مرة (private: بيانات فني، مو للـ proxies)
+            resp.cache_control.private = True
+            resp.cache_control.no_cache = True
+            return resp
+
+        return wrapper
+
+    return decorator
+
+
 # =========================================================
 # ✅ Supabase helper functions (موجودة عندك) — نخليها بدون حذف
 # بس راح “نخليها غير مستخدمة” لأن نعتمد REST أعلاه
@@ -109,6 +275,8 @@ def _supabase_client():
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         return None
     try:
+        # import هنا: الـ package ثقيل (~0.4s) وما نحتاجه إلا بهالمسار
+        from supabase import create_client
         return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
     except Exception:
         return None
@@ -189,8 +357,267 @@ print("SUPABASE_SERVICE_ROLE_KEY =", SUPABASE_SERVICE_ROLE_KEY[:10] if SUPABASE_
 print("SUPABASE_BUCKET =", SUPABASE_BUCKET)
 
 
+# =========================================================
+# ✅ نسخ مصغرة للصور (thumb / md) + srcset
+# =========================================================
+def store_image_variants(fileobj, stored_name):
+    """
+    يصنع thumb و md (WebP + JPEG/PNG) جنب الصورة الأصلية بنفس المكان (Supabase أو محلي).
+    يرجع JSON نخزنه بـ gifts.image_variants، أو None إذا ما صار (Pillow مو منصب / الملف مو صورة).
+    """
+    try:
+        rendered = images.make_variants(fileobj)
+    except Exception:
+        return None
+    if not rendered:
+        return None
+
+    on_supabase = ("/" in stored_name) and _use_supabase_storage()
+    stem = os.path.splitext(stored_name)[0]
+    out = {}
+    written = []
+    try:
+        for name, v in rendered.items():
+            out[name] = {"w": v["width"]}
+            for kind in ("webp", "fallback"):
+                data, ext, content_type = v[kind]
+                target = f"{stem}_{name}.{ext}"
+                if on_supabase:
+                    # مو بالطابور: الـ srcset يأشر عليها أول ما تنحفظ بالـ DB، فلازم تكون مرفوعة قبلها
+                    storage_client.upload(target, data, content_type)
+                else:
+                    with open(os.path.join(UPLOAD_DIR, target), "wb") as f:
+                        f.write(data)
+                written.append(target)
+                out[name][kind] = target
+    except Exception:
+        # نحذف اللي انكتب/انرفع حتى ما يبقى نص نسخ (حذف Supabase بالطابور)، والهدية تعرض الأصل.
+        # إذا رفع ثاني لنفس الصورة سجلها، نفس أسماء النسخ صارت إله => ما نلمسها
+        if db.object_refcount(stored_name) is not None:
+            return None
+        con = db.connect()
+        for target in written:
+            try:
+                delete_stored_image(target, con=con, guard_key=stored_name)
+            except Exception:
+                pass
+        con.commit()
+        con.close()
+        storage.notify()
+        return None
+
+    return json.dumps(out)
+
+
+def _image_variants(variants):
+    if not variants:
+        return None
+    try:
+        return json.loads(variants) if isinstance(variants, str) else variants
+    except ValueError:
+        return None
+
+
+def gift_image_srcset(variants, kind="fallback"):
+    v = _image_variants(variants)
+    if not v:
+        return None
+    return ", ".join(
+        f"{gift_image_url(v[name][kind])} {v[name]['w']}w"
+        for name in images.VARIANT_SIZES
+        if name in v and kind in v[name]
+    )
+
+
+def gift_picture(image_filename, variants=None, sizes="72px", alt=""):
+    """
+    <picture> مع WebP + srcset، والمتصفح يختار أصغر نسخة تكفي الـ sizes.
+    إذا الهدية قديمة وما عندها نسخ => <img> عادي على الأصل.
+    """
+    src = gift_image_url(image_filename)
+    if not src:
+        return Markup("")
+
+    v = _image_variants(variants)
+    if not v or "thumb" not in v:
+        return Markup('<img src="{}" alt="{}" loading="lazy">').format(src, alt)
+
+    return Markup(
+        '<picture>'
+        '<source type="image/webp" srcset="{webp}" sizes="{sizes}">'
+        '<img src="{fallback}" srcset="{srcset}" sizes="{sizes}" alt="{alt}" loading="lazy">'
+        '</picture>'
+    ).format(
+        webp=gift_image_srcset(v, "webp"),
+        srcset=gift_image_srcset(v, "fallback"),
+        fallback=gift_image_url(v["thumb"]["fallback"]),
+        sizes=sizes,
+        alt=alt,
+    )
+
+
+# =========================================================
+# ✅ تخزين الصور حسب المحتوى (sha256): نفس الصورة تنرفع مرة وحدة بس
+# stored_objects.refcount = كم هدية تستخدم نفس الملف
+# =========================================================
+# أول bytes من الملف => النوع الحقيقي (ما نعتمد على Content-Type اللي يرسله المتصفح)
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"GIF87a", "image/gif", ".gif"),
+    (b"GIF89a", "image/gif", ".gif"),
+)
+
+
+def sniff_image_type(head):
+    """يرجع (content_type, ext) أو (None, None) إذا مو صورة معروفة."""
+    for sig, content_type, ext in _IMAGE_SIGNATURES:
+        if head.startswith(sig):
+            return content_type, ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    return None, None
+
+
+def _content_key(stream, filename, folder="", max_size=None):
+    """
+    قراءة وحدة chunk chunk: sha256 + الحجم + نوع الملف من أول chunk.
+    يرجع (key, size, content_type). key = sha256 + الامتداد، و gifts/ قدامه إذا Supabase.
+    """
+    h = hashlib.sha256()
+    size = 0
+    content_type, ext = None, None
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+        if size == 0:
+            content_type, ext = sniff_image_type(chunk)
+        h.update(chunk)
+        size += len(chunk)
+        if max_size and size > max_size:
+            raise RequestEntityTooLarge()
+    stream.seek(0)
+
+    if ext is None:
+        ext = os.path.splitext(secure_filename(filename or ""))[1].lower()
+        if ext == ".jpeg":
+            ext = ".jpg"
+    name = h.hexdigest() + ext
+    return (f"{folder}/{name}" if folder else name), size, content_type
+
+
+def _store_object(file_storage, on_supabase):
+    key, size, content_type = _content_key(
+        file_storage.stream, file_storage.filename, "gifts" if on_supabase else "",
+        max_size=current_app.config["MAX_CONTENT_LENGTH"],
+    )
+    content_type = content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    row = db.acquire_object(key)
+    if row is not None:
+        # نفس الصورة موجودة => بدون رفع وبدون معالجة
+        return key, row["variants"]
+
+    # أول مرة: نرفع الملف ونسخه، وبعدها بس نسجله بـ stored_objects.
+    # رفعين بنفس الوقت لنفس الصورة يرفعون الاثنين (نفس الـ bytes) وكل واحد ياخذ reference،
+    # وإذا الرفع فشل ماكو صف => ماكو هدية تأشر على ملف مو موجود.
+    # الاثنين stream: requests يقرا الملف chunk chunk، و save() = copyfileobj
+    if on_supabase:
+        supabase_upload_bytes(file_storage.stream, key, content_type)
+    else:
+        _save_upload(file_storage, os.path.join(UPLOAD_DIR, key))
+    file_storage.stream.seek(0)
+    variants = store_image_variants(file_storage.stream, key)
+    return key, db.register_object(key, content_type, size, variants)
+
+
+def _save_upload(file_storage, path):
+    # ملف مؤقت + os.replace: رفع ثاني لنفس الـ hash ما يشوف ملف نصه مكتوب
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            file_storage.save(f, buffer_size=UPLOAD_CHUNK_SIZE)
+        os.replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def store_gift_image(file_storage):
+    """يرجع (image_filename, image_variants) للهدية."""
+    if _use_supabase_storage():
+        try:
+            # ✅ Supabase Storage (REST)
+            return _store_object(file_storage, on_supabase=True)
+        except RequestEntityTooLarge:
+            raise
+        except Exception:
+            # إذا فشل رفع supabase لأي سبب، نخليه محلي
+            pass
+    return _store_object(file_storage, on_supabase=False)
+
+
+def delete_object_files(con, key, variants):
+    for img_val in [key] + _variant_paths(variants):
+        delete_stored_image(img_val, con=con, guard_key=key)
+
+
+def _variant_paths(variants):
+    paths = []
+    for v in (_image_variants(variants) or {}).values():
+        paths += [v[kind] for kind in ("webp", "fallback") if v.get(kind)]
+    return paths
+
+
+def release_gift_image(con, image_filename, image_variants):
+    """
+    الهدية ما عادت تستخدم الصورة: ننقص الـ refcount، والملف ينحذف بس إذا آخر وحدة.
+    الصور القديمة (قبل الـ hash) ما إلها refcount => تنحذف مباشرة مثل قبل.
+    بدون commit: ينادى من db.delete_gift بنفس الـ transaction (storage.notify() بعد الـ commit).
+    """
+    if db.release_object(image_filename, delete_object_files, con=con) is None:
+        for img_val in [image_filename] + _variant_paths(image_variants):
+            try:
+                delete_stored_image(img_val, con=con)
+            except Exception:
+                pass
+
+
+def delete_stored_image(img_val, con=None, guard_key=None):
+    """
+    يحذف صورة (Supabase أو محلي) حسب القيمة المخزنة بالـ DB.
+    مع con: حذف Supabase ينضاف لطابور storage_jobs بنفس الـ transaction (يتنفذ بالخلفية).
+    """
+    img_val = str(img_val)
+
+    def _supabase_delete(object_path):
+        if con is not None:
+            storage.enqueue_delete(con, object_path, guard_key=guard_key)
+        else:
+            supabase_delete_file(object_path)
+
+    # ✅ (إضافة جديدة) إذا كانت الصورة رابط كامل قديم:
+    # نحاول نستخرج object_path ونحذفه من Supabase
+    if _use_supabase_storage() and img_val.startswith("http"):
+        marker = f"/storage/v1/object/public/{SUPABASE_BUCKET}/"
+        if marker in img_val:
+            object_path = img_val.split(marker, 1)[1]
+            if object_path:
+                _supabase_delete(object_path)
+
+    # ✅ إذا نخزن path مثل gifts/xxx.png
+    elif _use_supabase_storage() and ("/" in img_val) and (not img_val.startswith("http")):
+        _supabase_delete(img_val)
+
+    else:
+        # ✅ حذف محلي (قديمة)
+        img_path = os.path.join(UPLOAD_DIR, img_val)
+        if os.path.exists(img_path):
+            os.remove(img_path)
+
+
 # ---------- Init DB + seed super admin ----------
 def bootstrap():
+    global _bootstrapped
     db.init_db()
     con = db.connect()
     row = con.execute("SELECT id FROM admins WHERE email=?", ("admin@example.com",)).fetchone()
@@ -201,18 +628,30 @@ def bootstrap():
         )
         con.commit()
     con.close()
+    _bootstrapped = True
+
 
+@routes.cli.command("bootstrap")
+def bootstrap_command():
+    """migrations + super admin (خطوة الـ deploy: flask --app app bootstrap)."""
+    bootstrap()
+    print(f"schema version {db.SCHEMA_VERSION}")
 
-bootstrap()
+
+def winners_changed():
+    """بعد أي كتابة تغير الرابحين/النقاط (بعد الـ commit): leaderboards + صفحة /winners."""
+    db.invalidate_leaderboards()
+    page_cache.invalidate("winners")
 
 
 # ---------- Admin Auth ----------
-@app.get("/admin/login")
+@routes.get("/admin/login")
+@page_cache.cached_page(ttl=300)
 def admin_login():
     return render_template("admin_login.html", site_name=SITE_NAME)
 
 
-@app.post("/admin/login")
+@routes.post("/admin/login")
 def admin_login_post():
     email = request.form.get("email", "").strip()
     password = request.form.get("password", "").strip()
@@ -230,54 +669,120 @@ def admin_login_post():
     return render_template("admin_login.html", site_name=SITE_NAME, error="بيانات الدخول غير صحيحة")
 
 
-@app.get("/admin/logout")
+@routes.get("/admin/logout")
 def admin_logout():
     session.clear()
     return redirect(url_for("admin_login"))
 
 
 # ---------- Admin Dashboard ----------
-@app.get("/admin")
+@routes.get("/admin")
+@db.replica_reads
 def admin_dashboard():
     if not admin_required():
         return redirect(url_for("admin_login"))
 
+    counters = db.get_counters()
     con = db.connect()
-    tech_count = con.execute("SELECT COUNT(*) c FROM technicians").fetchone()["c"]
-    gifts_available = con.execute("SELECT COUNT(*) c FROM gifts WHERE is_active=1").fetchone()["c"]
-    points_total = con.execute("SELECT COALESCE(SUM(points_added),0) s FROM points_tx").fetchone()["s"]
+    # idx_technicians_points => قراءة أول صف من الـ index بدل sort
     best = con.execute("SELECT name FROM technicians ORDER BY points DESC LIMIT 1").fetchone()
     con.close()
 
     stats = {
-        "technicians_count": tech_count,
-        "gifts_available": gifts_available,
-        "points_total": points_total,
+        "technicians_count": counters["technicians_count"],
+        "gifts_available": counters["gifts_active"],
+        "points_total": counters["points_total"],
         "best_performance": best["name"] if best else "غير متوفر",
         "db_status": "قاعدة البيانات متصلة",
+        # طابور Supabase (الحذف بالخلفية)
+        "storage_queue": db.storage_job_stats() if _use_supabase_storage() else None,
+        "page_cache": page_cache.stats(),
     }
     return render_template("admin_dashboard.html", site_name=SITE_NAME, stats=stats)
 
 
+@routes.get("/admin/slow-queries")
+def admin_slow_queries():
+    if not admin_required():
+        return redirect(url_for("admin_login"))
+
+    # ?scans=1 => بس اللي بيها full scan
+    scans_only = request.args.get("scans") == "1"
+    return render_template(
+        "admin_slow_queries.html",
+        site_name=SITE_NAME,
+        entries=slow_queries.recent(limit=200, full_scan_only=scans_only),
+        scans_only=scans_only,
+        settings=current_app.extensions["slow_queries"],
+        format_plan=slow_queries.format_plan,
+    )
+
+
+@routes.get("/admin/reports")
+def admin_reports():
+    if not admin_required():
+        return redirect(url_for("admin_login"))
+
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD (الافتراضي آخر 30 يوم)
+    today = datetime.now().date()
+    date_from = request.args.get("from", "").strip()
+    date_to = request.args.get("to", "").strip()
+    since, until = db.day_range(date_from, date_to)
+    if since is None:
+        date_from = (today - timedelta(days=29)).isoformat()
+    if until is None:
+        date_to = today.isoformat()
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+
+    # قراءة بس: الـ rollups يحدثها `flask refresh-rollups` (cron)، والصفحة تعرض لوين واصلة
+    data = db.report(date_from, date_to)
+
+    return render_template(
+        "admin_reports.html",
+        site_name=SITE_NAME,
+        date_from=date_from,
+        date_to=date_to,
+        report=data,
+        status=db.rollup_status(),
+    )
+
+
 # ---------- Admin: Technicians ----------
-@app.get("/admin/techs")
+@routes.get("/admin/techs")
+@db.replica_reads
 def admin_techs():
     if not admin_required():
         return redirect(url_for("admin_login"))
-    con = db.connect()
-    techs = con.execute("SELECT * FROM technicians ORDER BY id DESC").fetchall()
-    con.close()
-    return render_template("admin_techs.html", site_name=SITE_NAME, techs=techs)
+    before = request.args.get("before", type=int)
+    techs, next_before = db.list_technicians(before_id=before, limit=TECHS_PAGE_SIZE)
+    return render_template(
+        "admin_techs.html",
+        site_name=SITE_NAME,
+        techs=techs,
+        total=db.get_counters()["technicians_count"],
+        next_before=next_before,
+        is_first_page=not before,
+    )
+
 
+@routes.get("/admin/techs/search")
+@db.replica_reads
+def admin_techs_search():
+    # typeahead: ?q= أول رقم الهاتف أو أول الاسم
+    if not admin_required():
+        return jsonify({"error": "unauthorized"}), 401
+    return jsonify(db.search_technicians(request.args.get("q", ""), limit=20))
 
-@app.get("/admin/techs/new")
+
+@routes.get("/admin/techs/new")
 def admin_tech_new():
     if not admin_required():
         return redirect(url_for("admin_login"))
     return render_template("admin_tech_form.html", site_name=SITE_NAME, mode="new")
 
 
-@app.post("/admin/techs/new")
+@routes.post("/admin/techs/new")
 def admin_tech_new_post():
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -297,18 +802,20 @@ def admin_tech_new_post():
             INSERT INTO technicians(name, phone, password, specialty, points, created_at)
             VALUES (?,?,?,?,0,?)
         """, (name, phone, password, specialty, db.now()))
+        db.bump_counter(con, "technicians_count", 1)
         con.commit()
     except Exception:
         con.close()
         flash("رقم الهاتف مستخدم مسبقاً", "err")
         return redirect(url_for("admin_tech_new"))
     con.close()
+    winners_changed()
 
     flash("تمت إضافة الفني بنجاح", "ok")
     return redirect(url_for("admin_techs"))
 
 
-@app.get("/admin/techs/<int:tech_id>/edit")
+@routes.get("/admin/techs/<int:tech_id>/edit")
 def admin_tech_edit(tech_id):
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -320,7 +827,7 @@ def admin_tech_edit(tech_id):
     return render_template("admin_tech_form.html", site_name=SITE_NAME, mode="edit", tech=tech)
 
 
-@app.post("/admin/techs/<int:tech_id>/edit")
+@routes.post("/admin/techs/<int:tech_id>/edit")
 def admin_tech_edit_post(tech_id):
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -343,12 +850,15 @@ def admin_tech_edit_post(tech_id):
                 SET name=?, phone=?, specialty=?, password=?
                 WHERE id=?
             """, (name, phone, specialty, new_password, tech_id))
+            # كلمة سر جديدة => التطبيق يسجل دخول من جديد
+            db.revoke_api_tokens(con, tech_id)
         else:
             con.execute("""
                 UPDATE technicians
                 SET name=?, phone=?, specialty=?
                 WHERE id=?
             """, (name, phone, specialty, tech_id))
+        db.bump_versions(con, [db.tech_scope(tech_id)])
         con.commit()
     except Exception:
         con.close()
@@ -356,37 +866,47 @@ def admin_tech_edit_post(tech_id):
         return redirect(url_for("admin_tech_edit", tech_id=tech_id))
 
     con.close()
+    winners_changed()
     flash("تم التعديل بنجاح", "ok")
     return redirect(url_for("admin_techs"))
 
 
-@app.post("/admin/techs/<int:tech_id>/delete")
+@routes.post("/admin/techs/<int:tech_id>/delete")
 def admin_tech_delete(tech_id):
     if not admin_required():
         return redirect(url_for("admin_login"))
     con = db.connect()
-    con.execute("DELETE FROM technicians WHERE id=?", (tech_id,))
+    deleted = con.execute("DELETE FROM technicians WHERE id=? RETURNING id", (tech_id,)).fetchall()
+    if deleted:
+        db.bump_counter(con, "technicians_count", -1)
+        db.bump_versions(con, [db.tech_scope(tech_id)])
+        db.revoke_api_tokens(con, tech_id)
     con.commit()
     con.close()
+    winners_changed()
     flash("تم حذف الفني", "ok")
     return redirect(url_for("admin_techs"))
 
 
 # ---------- Admin: Add Points ----------
-@app.get("/admin/points")
+@routes.get("/admin/points")
+@db.replica_reads
 def admin_points():
     if not admin_required():
         return redirect(url_for("admin_login"))
 
     iqd_per_point = int(db.get_setting("iqd_per_point", "10000"))
 
-    con = db.connect()
-    techs = con.execute("SELECT id,name,phone,points FROM technicians ORDER BY name").fetchall()
-    con.close()
-    return render_template("admin_points.html", site_name=SITE_NAME, techs=techs, iqd_per_point=iqd_per_point)
+    # ما نحمل الفنيين هنا، الصفحة تبحث عنهم من /admin/techs/search
+    return render_template(
+        "admin_points.html",
+        site_name=SITE_NAME,
+        iqd_per_point=iqd_per_point,
+        q=request.args.get("q", "").strip(),
+    )
 
 
-@app.post("/admin/points/add")
+@routes.post("/admin/points/add")
 def admin_points_add():
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -394,28 +914,122 @@ def admin_points_add():
     tech_id = int(request.form.get("tech_id", "0"))
     amount = int(request.form.get("amount", "0") or 0)
     iqd_per_point = int(db.get_setting("iqd_per_point", "10000"))
+    # نرجع لنفس البحث حتى الكاشير يكمل على نفس الفني
+    q = request.form.get("q", "").strip()
 
     if tech_id <= 0 or amount <= 0:
         flash("أدخل مبلغ صحيح", "err")
-        return redirect(url_for("admin_points"))
+        return redirect(url_for("admin_points", q=q or None))
 
     points = max(1, amount // iqd_per_point)
 
     con = db.connect()
     con.execute("UPDATE technicians SET points = points + ? WHERE id=?", (points, tech_id))
     con.execute("""
-        INSERT INTO points_tx(tech_id, purchase_amount, points_added, created_at, admin_id)
-        VALUES (?,?,?,?,?)
-    """, (tech_id, amount, points, db.now(), current_admin_id()))
+        INSERT INTO points_tx(tech_id, purchase_amount, points_added, created_at, created_ts, admin_id)
+        VALUES (?,?,?,?,?,?)
+    """, (tech_id, amount, points, *db.ledger_now(), current_admin_id()))
+    db.bump_counter(con, "points_total", points)
+    db.add_leaderboard_points(con, tech_id, points)
+    db.bump_versions(con, [db.tech_scope(tech_id)])
     con.commit()
     con.close()
+    winners_changed()
 
     flash(f"تمت إضافة {points} نقطة", "ok")
-    return redirect(url_for("admin_points"))
+    return redirect(url_for("admin_points", q=q or None))
+
+
+@routes.get("/admin/points/history")
+@db.replica_reads
+def admin_points_history():
+    if not admin_required():
+        return redirect(url_for("admin_login"))
+
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD&tech_id=
+    date_from = request.args.get("from", "").strip()
+    date_to = request.args.get("to", "").strip()
+    tech_id = request.args.get("tech_id", type=int)
+    since, until = db.day_range(date_from, date_to)
+
+    rows, totals = db.list_points_tx(tech_id=tech_id, since=since, until=until)
+    return render_template(
+        "admin_points_history.html",
+        site_name=SITE_NAME,
+        rows=rows,
+        totals=totals,
+        # نرجع بس القيم اللي انفهمت للفورم
+        date_from=date_from if since is not None else "",
+        date_to=date_to if until is not None else "",
+        tech_id=tech_id,
+    )
+
+
+# ---------- Admin: CSV export (المحاسبة) ----------
+@routes.get("/admin/export/<kind>.csv")
+def admin_export(kind):
+    if not admin_required():
+        return redirect(url_for("admin_login"))
+    if kind not in exports.EXPORTS:
+        abort(404)
+
+    # نفس فلاتر سجل النقاط / الرابحين: ?from=&to=&tech_id=&status=&gzip=1
+    date_from = request.args.get("from", "").strip()
+    date_to = request.args.get("to", "").strip()
+    since, until = db.day_range(date_from, date_to)
+    tech_id = request.args.get("tech_id", type=int)
+    status = request.args.get("status", "").strip()
+    if status not in exports.REDEMPTION_STATUSES:
+        status = None
+    compress = request.args.get("gzip") == "1"
+
+    columns, rows = exports.EXPORTS[kind][1](since=since, until=until, tech_id=tech_id, status=status)
+    name = exports.filename(
+        kind,
+        date_from if since is not None else "",
+        date_to if until is not None else "",
+        tech_id,
+        compress,
+    )
+    resp = current_app.response_class(
+        stream_with_context(exports.csv_stream(columns, rows, compress)),
+        mimetype="application/gzip" if compress else "text/csv",
+    )
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+# ---------- Admin: Bulk CSV import ----------
+@routes.get("/admin/import")
+def admin_import():
+    if not admin_required():
+        return redirect(url_for("admin_login"))
+    return render_template("admin_import.html", site_name=SITE_NAME, report=None)
+
+
+@routes.post("/admin/import")
+def admin_import_post():
+    if not admin_required():
+        return redirect(url_for("admin_login"))
+
+    kind = request.form.get("kind", "points")
+    file = request.files.get("file")
+    if not file or not file.filename:
+        flash("اختر ملف CSV", "err")
+        return redirect(url_for("admin_import"))
+
+    if kind == "techs":
+        report = bulk_import.import_technicians(file.stream)
+    else:
+        report = bulk_import.import_points(file.stream, current_admin_id())
+
+    return render_template("admin_import.html", site_name=SITE_NAME, report=report)
 
 
 # ---------- Admin: Gifts ----------
-@app.get("/admin/gifts")
+@routes.get("/admin/gifts")
+@db.replica_reads
 def admin_gifts():
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -429,18 +1043,19 @@ def admin_gifts():
         site_name=SITE_NAME,
         gifts=gifts,
         gift_image_url=gift_image_url,  # ✅ NEW
+        gift_picture=gift_picture,
         storage_public_base=supabase_public_base() if _use_supabase_storage() else None
     )
 
 
-@app.get("/admin/gifts/new")
+@routes.get("/admin/gifts/new")
 def admin_gift_new():
     if not admin_required():
         return redirect(url_for("admin_login"))
     return render_template("admin_gift_form.html", site_name=SITE_NAME)
 
 
-@app.post("/admin/gifts/new")
+@routes.post("/admin/gifts/new")
 def admin_gift_new_post():
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -454,28 +1069,17 @@ def admin_gift_new_post():
         return redirect(url_for("admin_gift_new"))
 
     filename = None
+    variants = None
     if file and file.filename:
-        try:
-            if _use_supabase_storage():
-                # ✅ Supabase Storage (REST)
-                filename = supabase_upload_file(file, folder="gifts")
-            else:
-                # ✅ fallback محلي
-                safe = secure_filename(file.filename)
-                filename = f"{int(__import__('time').time())}_{safe}"
-                file.save(os.path.join(UPLOAD_DIR, filename))
-        except Exception:
-            # إذا فشل رفع supabase لأي سبب، نخليه محلي
-            safe = secure_filename(file.filename)
-            filename = f"{int(__import__('time').time())}_{safe}"
-            file.seek(0)
-            file.save(os.path.join(UPLOAD_DIR, filename))
+        filename, variants = store_gift_image(file)
 
     con = db.connect()
     con.execute("""
-        INSERT INTO gifts(name, points_required, image_filename, is_active, created_at)
-        VALUES (?,?,?,?,?)
-    """, (name, points_required, filename, 1, db.now()))
+        INSERT INTO gifts(name, points_required, image_filename, image_variants, is_active, created_at)
+        VALUES (?,?,?,?,?,?)
+    """, (name, points_required, filename, variants, 1, db.now()))
+    db.bump_counter(con, "gifts_active", 1)
+    db.bump_versions(con, ["gifts"])
     con.commit()
     con.close()
 
@@ -483,7 +1087,7 @@ def admin_gift_new_post():
     return redirect(url_for("admin_gifts"))
 
 
-@app.post("/admin/gifts/<int:gift_id>/toggle")
+@routes.post("/admin/gifts/<int:gift_id>/toggle")
 def admin_gift_toggle(gift_id):
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -492,61 +1096,41 @@ def admin_gift_toggle(gift_id):
     if gift:
         new_val = 0 if gift["is_active"] == 1 else 1
         con.execute("UPDATE gifts SET is_active=? WHERE id=?", (new_val, gift_id))
+        db.bump_counter(con, "gifts_active", 1 if new_val == 1 else -1)
+        db.bump_versions(con, ["gifts"])
         con.commit()
     con.close()
     return redirect(url_for("admin_gifts"))
 
 
-@app.post("/admin/gifts/<int:gift_id>/delete")
+@routes.post("/admin/gifts/<int:gift_id>/delete")
 def admin_delete_gift(gift_id):
     if not admin_required():
         return redirect(url_for("admin_login"))
 
-    gift = db.get_gift_by_id(gift_id)
-    if gift and gift["image_filename"]:
-        try:
-            img_val = str(gift["image_filename"])
-
-            # ✅ (إضافة جديدة) إذا كانت الصورة رابط كامل قديم:
-            # نحاول نستخرج object_path ونحذفه من Supabase
-            if _use_supabase_storage() and img_val.startswith("http"):
-                marker = f"/storage/v1/object/public/{SUPABASE_BUCKET}/"
-                if marker in img_val:
-                    object_path = img_val.split(marker, 1)[1]
-                    if object_path:
-                        supabase_delete_file(object_path)
-
-            # ✅ إذا نخزن path مثل gifts/xxx.png
-            elif _use_supabase_storage() and ("/" in img_val) and (not img_val.startswith("http")):
-                supabase_delete_file(img_val)
-
-            else:
-                # ✅ حذف محلي (قديمة)
-                img_path = os.path.join(UPLOAD_DIR, img_val)
-                if os.path.exists(img_path):
-                    os.remove(img_path)
-
-        except Exception:
-            pass
-
-    db.delete_gift(gift_id)
+    # الصورة تنحرر بنفس transaction الحذف، وبس إذا الصف انحذف فعلاً
+    # (حذفين بنفس الوقت ما ينقصون الـ refcount مرتين)
+    if db.delete_gift(gift_id, release_gift_image):
+        storage.notify()
     flash("تم حذف الهدية", "ok")
     return redirect(url_for("admin_gifts"))
 
 
 # ---------- Public/Home ----------
-@app.get("/")
+@routes.get("/")
+@page_cache.cached_page(ttl=300)
 def home():
     return render_template("index.html", site_name=SITE_NAME)
 
 
 # ---------- User Auth (Technician) ----------
-@app.get("/login")
+@routes.get("/login")
+@page_cache.cached_page(ttl=300)
 def user_login():
     return render_template("user_login.html", site_name=SITE_NAME)
 
 
-@app.post("/login")
+@routes.post("/login")
 def user_login_post():
     phone = request.form.get("phone", "").strip()
     password = request.form.get("password", "").strip()
@@ -563,14 +1147,16 @@ def user_login_post():
     return render_template("user_login.html", site_name=SITE_NAME, error="بيانات الدخول غير صحيحة")
 
 
-@app.get("/logout")
+@routes.get("/logout")
 def user_logout():
     session.clear()
     return redirect(url_for("user_login"))
 
 
 # ---------- User Pages ----------
-@app.get("/me")
+@routes.get("/me")
+@db.replica_reads
+@versioned_page()
 def user_dashboard():
     if not user_required():
         return redirect(url_for("user_login"))
@@ -580,7 +1166,9 @@ def user_dashboard():
     return render_template("user_dashboard.html", site_name=SITE_NAME, user=user)
 
 
-@app.get("/gifts")
+@routes.get("/gifts")
+@db.replica_reads
+@versioned_page("gifts")
 def user_gifts():
     if not user_required():
         return redirect(url_for("user_login"))
@@ -596,49 +1184,40 @@ def user_gifts():
         user=user,
         gifts=gifts,
         gift_image_url=gift_image_url,  # ✅ NEW
+        gift_picture=gift_picture,
         storage_public_base=supabase_public_base() if _use_supabase_storage() else None
     )
 
 
-@app.post("/gifts/<int:gift_id>/redeem")
+@routes.post("/gifts/<int:gift_id>/redeem")
 def user_redeem(gift_id):
     if not user_required():
         return redirect(url_for("user_login"))
 
-    con = db.connect()
-    user = con.execute("SELECT id,points FROM technicians WHERE id=?", (current_user_id(),)).fetchone()
-    gift = con.execute("SELECT * FROM gifts WHERE id=? AND is_active=1", (gift_id,)).fetchone()
+    status, new_points = db.redeem_gift(current_user_id(), gift_id)
 
-    if not gift or not user:
-        con.close()
+    if status == db.REDEEM_NOT_FOUND:
         return redirect(url_for("user_gifts"))
 
-    if user["points"] < gift["points_required"]:
-        con.close()
+    if status == db.REDEEM_INSUFFICIENT:
         flash("لا يمكن بسبب عدم كفاية الرصيد", "err")
         return redirect(url_for("user_gifts"))
 
-    con.execute("UPDATE technicians SET points = points - ? WHERE id=?", (gift["points_required"], user["id"]))
-    con.execute("""
-        INSERT INTO redemptions(tech_id, gift_id, points_spent, created_at, status)
-        VALUES (?,?,?,?,?)
-    """, (user["id"], gift["id"], gift["points_required"], db.now(), "pending"))
-    con.commit()
-
-    new_points = con.execute("SELECT points FROM technicians WHERE id=?", (user["id"],)).fetchone()["points"]
-    con.close()
-
+    # الرابحين (بدون جدول winners) = الفنيين حسب الرصيد
+    winners_changed()
     return render_template("user_congrats.html", site_name=SITE_NAME, new_points=new_points)
 
 
-@app.get("/my-gifts")
+@routes.get("/my-gifts")
+@db.replica_reads
+@versioned_page("gifts")
 def user_my_gifts():
     if not user_required():
         return redirect(url_for("user_login"))
 
     con = db.connect()
     rows = con.execute("""
-        SELECT r.created_at, g.name, g.image_filename, r.points_spent
+        SELECT r.created_at, g.name, g.image_filename, g.image_variants, r.points_spent
         FROM redemptions r
         JOIN gifts g ON g.id = r.gift_id
         WHERE r.tech_id=?
@@ -651,19 +1230,179 @@ def user_my_gifts():
         site_name=SITE_NAME,
         rows=rows,
         gift_image_url=gift_image_url,  # ✅ NEW
+        gift_picture=gift_picture,
         storage_public_base=supabase_public_base() if _use_supabase_storage() else None
     )
 
 
+# ---------- API v1 (تطبيق الموبايل) ----------
+# زيده إذا تغير شكل الـ JSON حتى الـ ETags القديمة ما ترجع 304
+API_REVISION = "1"
+
+
+def api_tech_id():
+    """الفني صاحب الـ Bearer token (من الـ primary: token توه انصدر ممكن ما وصل الـ replica)."""
+    if "api_tech_id" not in g:
+        g.api_tech_id = db.api_token_tech(api.bearer_token())
+    if g.api_tech_id is None:
+        raise api.ApiError(401, "unauthorized", "token غير صالح")
+    return g.api_tech_id
+
+
+def versioned_api(*tables):
+    """
+    مثل versioned_page للـ API: ETag = hash(الـ endpoint + الفني + الـ query + versions)
+    => If-None-Match يرجع 304 بـ query وحدة قبل الـ queries.
+    الـ view ياخذ tech_id ويرجع dict. القراءة من الـ replica (إذا موجود) بعد التحقق من الـ token،
+    فبعد redeem مباشرة الرصيد ممكن يتأخر لحظة => الـ redeem نفسه يرجع الرصيد الجديد.
+    """
+    def decorator(view):
+        @db.replica_reads
+        def respond(tech_id, *args, **kwargs):
+            versions = db.get_versions([*tables, db.tech_scope(tech_id)])
+            etag = hashlib.sha256(
+                f"{API_REVISION}|{SUPABASE_URL}|{request.endpoint}|{tech_id}|"
+                f"{sorted(request.args.items(multi=True))}|{sorted(versions.items())}".encode()
+            ).hexdigest()[:32]
+            if request.if_none_match.contains_weak(etag):
+                return api.json_response(None, etag=etag)
+            return api.json_response(view(tech_id, *args, **kwargs), etag=etag)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            return respond(api_tech_id(), *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _absolute_url(url):
+    # الصور المحلية /static/... => رابط كامل للتطبيق
+    return urljoin(request.host_url, url) if url else None
+
+
+def _api_gift(row):
+    v = _image_variants(row["image_variants"]) or {}
+    thumb = v.get("thumb") or {}
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "points_required": row["points_required"],
+        "image": _absolute_url(gift_image_url(row["image_filename"])),
+        "thumb": _absolute_url(gift_image_url(thumb.get("webp") or thumb.get("fallback"))),
+    }
+
+
+@routes.post("/api/v1/auth/token")
+def api_token_create():
+    data = api.request_data()
+    phone = str(data.get("phone", "")).strip()
+    password = str(data.get("password", "")).strip()
+
+    con = db.connect()
+    user = con.execute("SELECT id, password FROM technicians WHERE phone=?", (phone,)).fetchone()
+    con.close()
+
+    if not (user and user["password"] == password):
+        raise api.ApiError(401, "invalid_credentials", "بيانات الدخول غير صحيحة")
+
+    token = db.create_api_token(user["id"], str(data.get("device", "")).strip())
+    return api.json_response({"token": token, "tech_id": user["id"]}, status=201)
+
+
+@routes.delete("/api/v1/auth/token")
+def api_token_delete():
+    api_tech_id()
+    db.revoke_api_token(api.bearer_token())
+    return "", 204
+
+
+@routes.get("/api/v1/me")
+@versioned_api()
+def api_me(tech_id):
+    names = api.fields(api.ME_FIELDS)
+    con = db.connect()
+    user = con.execute("SELECT id, name, points FROM technicians WHERE id=?", (tech_id,)).fetchone()
+    con.close()
+    return api.project(user, names)
+
+
+@routes.get("/api/v1/gifts")
+@versioned_api("gifts")
+def api_gifts(tech_id):
+    names = api.fields(api.GIFT_FIELDS)
+    con = db.connect()
+    rows = con.execute("""
+        SELECT id, name, points_required, image_filename, image_variants
+        FROM gifts WHERE is_active=1 ORDER BY points_required ASC
+    """).fetchall()
+    con.close()
+    return {"items": [api.project(_api_gift(r), names) for r in rows]}
+
+
+@routes.get("/api/v1/redemptions")
+@versioned_api("gifts")
+def api_redemptions(tech_id):
+    names = api.fields(api.REDEMPTION_FIELDS)
+    limit, cursor = api.page_args()
+
+    # keyset على idx_redemptions_tech_id (tech_id, id DESC): كل صفحة نفس الكلفة
+    where, params = ["r.tech_id = ?"], [tech_id]
+    if cursor is not None:
+        where.append("r.id < ?")
+        params.append(cursor)
+    con = db.connect()
+    rows = con.execute(f"""
+        SELECT r.id, r.created_at, r.gift_id, g.name AS gift_name, r.points_spent, r.status
+        FROM redemptions r
+        LEFT JOIN gifts g ON g.id = r.gift_id
+        WHERE {" AND ".join(where)}
+        ORDER BY r.id DESC
+        LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+    con.close()
+
+    more = len(rows) > limit
+    rows = [dict(r, status=r["status"] or "pending") for r in rows[:limit]]
+    return {
+        "items": [api.project(r, names) for r in rows],
+        "next_cursor": str(rows[-1]["id"]) if more else None,
+    }
+
+
+@routes.post("/api/v1/gifts/<int:gift_id>/redeem")
+def api_redeem(gift_id):
+    tech_id = api_tech_id()
+    status, new_points = db.redeem_gift(tech_id, gift_id)
+
+    if status == db.REDEEM_NOT_FOUND:
+        raise api.ApiError(404, "not_found", "الهدية غير موجودة")
+    if status == db.REDEEM_INSUFFICIENT:
+        raise api.ApiError(409, "insufficient_points", "لا يمكن بسبب عدم كفاية الرصيد")
+
+    winners_changed()
+    return api.json_response({"status": "ok", "points": new_points})
+
+
 # ---------- Winners (Public) ----------
-@app.get("/winners")
+@routes.get("/winners")
+@db.replica_reads
+@page_cache.cached_page(tags=("winners",), args=("period",))
 def winners():
-    winners_list = db.get_winners()
-    return render_template("winners.html", site_name=SITE_NAME, winners=winners_list)
+    # ?period=week|month|all => ترتيب حسب النقاط المكتسبة بالفترة
+    period = request.args.get("period", "").strip()
+    if period in db.LEADERBOARD_PERIODS:
+        winners_list = db.get_leaderboard(period)
+    else:
+        period = ""
+        winners_list = db.get_winners()
+    return render_template("winners.html", site_name=SITE_NAME, winners=winners_list, period=period)
 
 
 
-@app.get("/admin/winners")
+@routes.get("/admin/winners")
+@db.replica_reads
 def admin_winners():
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -674,22 +1413,36 @@ def admin_winners():
     if status_filter not in ("pending", "delivered"):
         status_filter = "pending"
 
+    # فترة اختيارية: ?from=YYYY-MM-DD&to=YYYY-MM-DD (idx_redemptions_status_ts)
+    date_from = request.args.get("from", "").strip()
+    date_to = request.args.get("to", "").strip()
+    since, until = db.day_range(date_from, date_to)
+    where, params = ["r.status = ?"], [status_filter]
+    if since is not None:
+        where.append("r.created_ts >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("r.created_ts < ?")
+        params.append(until)
+    order = "r.created_ts DESC, r.id DESC" if since is not None or until is not None else "r.id DESC"
+
     con = db.connect()
-    rows = con.execute("""
+    rows = con.execute(f"""
         SELECT
             r.id AS redemption_id,
             t.name AS tech_name,
             g.name AS gift_name,
             g.image_filename AS image_filename,
+            g.image_variants AS image_variants,
             r.created_at AS won_at,
             r.status AS status
         FROM redemptions r
         JOIN technicians t ON t.id = r.tech_id
         JOIN gifts g ON g.id = r.gift_id
-        WHERE r.status = ?
-        ORDER BY r.id DESC
+        WHERE {" AND ".join(where)}
+        ORDER BY {order}
         LIMIT 200
-    """, (status_filter,)).fetchall()
+    """, params).fetchall()
     con.close()
 
     return render_template(
@@ -697,11 +1450,14 @@ def admin_winners():
         site_name=SITE_NAME,
         winners=rows,
         status_filter=status_filter,
-        gift_image_url=gift_image_url
+        date_from=date_from if since is not None else "",
+        date_to=date_to if until is not None else "",
+        gift_image_url=gift_image_url,
+        gift_picture=gift_picture,
     )
 
 
-@app.post("/admin/redemptions/<int:redemption_id>/deliver")
+@routes.post("/admin/redemptions/<int:redemption_id>/deliver")
 def admin_mark_delivered(redemption_id):
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -721,7 +1477,10 @@ def admin_mark_delivered(redemption_id):
         flash("هذا الطلب مستلم مسبقاً", "err")
         return redirect(url_for("admin_winners", status="delivered"))
 
-    con.execute("UPDATE redemptions SET status=? WHERE id=?", ("delivered", redemption_id))
+    rows = con.execute(
+        "UPDATE redemptions SET status=? WHERE id=? RETURNING tech_id", ("delivered", redemption_id)
+    ).fetchall()
+    db.bump_versions(con, [db.tech_scope(r["tech_id"]) for r in rows])
     con.commit()
     con.close()
 
@@ -733,7 +1492,7 @@ def admin_mark_delivered(redemption_id):
 # ===============================
 # ADMIN SETTINGS (تغيير بيانات الأدمن)
 # ===============================
-@app.get("/admin/settings")
+@routes.get("/admin/settings")
 def admin_settings():
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -744,7 +1503,7 @@ def admin_settings():
     return render_template("admin_settings.html", site_name=SITE_NAME)
 
 
-@app.post("/admin/settings")
+@routes.post("/admin/settings")
 def admin_settings_post():
     if not admin_required():
         return redirect(url_for("admin_login"))
@@ -768,6 +1527,152 @@ def admin_settings_post():
     return redirect(url_for("admin_settings"))
 
 
+# ---------- CLI ----------
+@routes.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """يعيد حساب عدادات لوحة التحكم من الجداول (flask --app app rebuild-stats)"""
+    for name, value in db.rebuild_counters().items():
+        print(f"{name} = {value}")
+
+
+@routes.cli.command("build-image-variants")
+def build_image_variants_command():
+    """يصنع thumb/md للهدايا القديمة اللي ما عندها نسخ (flask --app app build-image-variants)"""
+    import io
+
+    con = db.connect()
+    gifts = con.execute("""
+        SELECT id, image_filename FROM gifts
+        WHERE image_filename IS NOT NULL AND image_variants IS NULL
+    """).fetchall()
+    con.close()
+
+    done = 0
+    for g in gifts:
+        img_val = str(g["image_filename"])
+        try:
+            if "://" in img_val:
+                continue
+            if _use_supabase_storage() and "/" in img_val:
+                fileobj = io.BytesIO(storage_client.download(img_val))
+            else:
+                fileobj = open(os.path.join(UPLOAD_DIR, img_val), "rb")
+            with fileobj:
+                variants = store_image_variants(fileobj, img_val)
+        except Exception as e:
+            print(f"gift {g['id']}: {e}")
+            continue
+        if variants:
+            con = db.connect()
+            con.execute("UPDATE gifts SET image_variants=? WHERE id=?", (variants, g["id"]))
+            db.bump_versions(con, ["gifts"])
+            con.commit()
+            con.close()
+            if db.object_refcount(img_val) is not None:
+                db.set_object_variants(img_val, variants)
+            done += 1
+    print(f"{done}/{len(gifts)} gifts updated")
+
+
+@routes.cli.command("dedupe-uploads")
+@click.option("--prune", is_flag=True, help="يحذف ملفات uploads اللي ما تستخدمها أي هدية")
+def dedupe_uploads_command(prune):
+    """
+    ينقل صور static/uploads القديمة (<time>_<name>) لأسماء sha256 مع refcount،
+    والنسخ المكررة تنحذف (flask --app app dedupe-uploads). صور Supabase ما نلمسها هنا.
+    """
+    con = db.connect()
+    gifts = con.execute("""
+        SELECT id, image_filename, image_variants FROM gifts WHERE image_filename IS NOT NULL
+    """).fetchall()
+    con.close()
+
+    moved = 0
+    saved = 0
+    for g in gifts:
+        old = str(g["image_filename"])
+        path = os.path.join(UPLOAD_DIR, old)
+        if "/" in old or "://" in old or not os.path.exists(path):
+            continue
+        if db.object_refcount(old) is not None:
+            continue
+
+        with open(path, "rb") as f:
+            key, size, content_type = _content_key(f, old)
+        key_path = os.path.join(UPLOAD_DIR, key)
+        if key != old:
+            if os.path.exists(key_path):
+                os.remove(path)
+                saved += size
+            else:
+                os.replace(path, key_path)
+
+        # النسخ المصغرة القديمة تنحذف، وكل hash ياخذ نسخه مرة وحدة
+        for v in _variant_paths(g["image_variants"]):
+            if os.path.exists(os.path.join(UPLOAD_DIR, v)):
+                os.remove(os.path.join(UPLOAD_DIR, v))
+
+        row = db.acquire_object(key)
+        if row is not None:
+            variants = row["variants"]
+        else:
+            with open(key_path, "rb") as f:
+                variants = store_image_variants(f, key)
+            variants = db.register_object(key, content_type or mimetypes.guess_type(key)[0], size, variants)
+
+        con = db.connect()
+        con.execute("UPDATE gifts SET image_filename=?, image_variants=? WHERE id=?", (key, variants, g["id"]))
+        db.bump_versions(con, ["gifts"])
+        con.commit()
+        con.close()
+        moved += 1
+
+    # ملفات ما مربوطة بأي هدية (بقايا رفع قديم)
+    con = db.connect()
+    used = set()
+    for g in con.execute("SELECT image_filename, image_variants FROM gifts WHERE image_filename IS NOT NULL").fetchall():
+        used.add(str(g["image_filename"]))
+        used.update(_variant_paths(g["image_variants"]))
+    con.close()
+    orphans = [f for f in os.listdir(UPLOAD_DIR) if f not in used]
+    orphan_bytes = sum(os.path.getsize(os.path.join(UPLOAD_DIR, f)) for f in orphans)
+    if prune:
+        for f in orphans:
+            os.remove(os.path.join(UPLOAD_DIR, f))
+        saved += orphan_bytes
+
+    print(f"{moved} gifts moved to content-addressed files, {saved} bytes freed")
+    if orphans and not prune:
+        print(f"{len(orphans)} unused files ({orphan_bytes} bytes) — rerun with --prune to delete them")
+
+
+@routes.cli.command("backfill-timestamps")
+@click.option("--batch-size", type=int, default=None, help="صفوف لكل UPDATE (الافتراضي LEDGER_BACKFILL_BATCH)")
+@click.option("--pause", type=float, default=0.0, help="ثواني بين الدفعات حتى نخفف الضغط على الـ DB")
+def backfill_timestamps_command(batch_size, pause):
+    """
+    يعبي created_ts لـ points_tx / redemptions من created_at (migration 10 يسويها،
+    وهذا لإكمالها إذا انقطعت) (flask --app app backfill-timestamps).
+    """
+    for table, batches in db.backfill_ledger_timestamps(batch_size=batch_size, pause=pause).items():
+        print(f"{table}: {batches} batches")
+
+
+@routes.cli.command("refresh-rollups")
+@click.option("--batch-size", type=int, default=None, help="صفوف ledger لكل دفعة (الافتراضي ROLLUP_BATCH)")
+def refresh_rollups_command(batch_size):
+    """
+    يضيف الفواتير/الاستبدالات الجديدة لجداول التقارير اليومية (flask --app app refresh-rollups).
+    صفحة التقارير تقرا بس، فهذا لازم يشتغل بـ cron (مثلاً كل 5 دقايق).
+    """
+    for name, rows in db.refresh_rollups(batch_size=batch_size).items():
+        print(f"{name}: {rows} rows")
+
+
+# بعد ما كل الـ routes فوق انسجلت على routes
+app = create_app()
+
+
 if __name__ == "__main__":
     app.run(debug=True)
 
@@ -0,0 +1,219 @@
+"""
+Static assets:
+- روابط فيها hash المحتوى (css/theme.<hash>.css) => Cache-Control: immutable لسنة،
+  وأي تعديل على الملف يطلع رابط جديد تلقائياً.
+- نسخ .gz و .br جاهزة جنب الملف (مثل gzip_static مال nginx)، تنبنى وقت التشغيل
+  أو بالـ deploy (flask --app app build-assets)، وتنرسل إذا المتصفح يقبلها.
+- static/uploads: الأسماء ما تتكرر (sha256 أو <time>_name) => هم immutable.
+
+بالـ templates: {{ asset_url('css/theme.css') }} بدل url_for('static', filename='css/theme.css')
+
+brotli اختياري: إذا مو منصب نكتفي بـ gzip.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+
+# ملفات نصية بس، الصور مضغوطة أصلاً
+COMPRESS_EXTS = (".css", ".js", ".svg", ".json", ".txt", ".map", ".html")
+# ما نعطيها hash (محتواها يتغير من الأدمن، والأسماء أصلاً فريدة)
+SKIP_DIRS = ("uploads",)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASH_LEN = 12
+
+_TEMPLATE_ASSET_RE = re.compile(r"""asset_url\(\s*['"]([^'"]+)['"]""")
+
+
+def brotli_available():
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _fingerprinted(rel, digest):
+    stem, ext = os.path.splitext(rel)
+    return f"{stem}.{digest[:HASH_LEN]}{ext}"
+
+
+def _walk(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.relpath(root, static_folder) == ".":
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            if name.endswith((".gz", ".br", ".tmp")):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_folder).replace(os.sep, "/"), path
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_if_stale(src, dst, compress):
+    """يكتب النسخة المضغوطة إذا ماكو أو أقدم من الأصل. يرجع الحجم أو None إذا ما تفيد."""
+    if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+        return os.path.getsize(dst)
+
+    with open(src, "rb") as f:
+        raw = f.read()
+    data = compress(raw)
+    if len(data) >= len(raw):
+        if os.path.exists(dst):
+            os.remove(dst)
+        return None
+
+    # اسم مؤقت خاص بهالكتابة: process ثاني يبني بنفس الوقت ما يكتب على نفس الملف
+    # (وإلا ممكن ننشر .gz مقصوص ويتخزن immutable)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(dst), prefix=os.path.basename(dst) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        f.write(data)
+    try:
+        os.replace(f.name, dst)
+    except OSError:
+        os.remove(f.name)
+        raise
+    return len(data)
+
+
+def _compressors():
+    out = [(".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli_available():
+        import brotli
+        out.append((".br", lambda raw: brotli.compress(raw, quality=11)))
+    return out
+
+
+def build(static_folder, compress=True):
+    """
+    يرجع {"manifest": {rel: fingerprinted}, "sizes": {rel: {"raw": n, ".gz": n, ".br": n}}}
+    compress=False => بس الـ hashes (مثلاً إذا static read-only وما بني بالـ deploy).
+    """
+    manifest = {}
+    sizes = {}
+    compressors = _compressors() if compress else []
+    for rel, path in _walk(static_folder):
+        manifest[rel] = _fingerprinted(rel, _digest(path))
+        sizes[rel] = {"raw": os.path.getsize(path)}
+        if not rel.endswith(COMPRESS_EXTS):
+            continue
+        for suffix, fn in compressors:
+            n = _write_if_stale(path, path + suffix, fn)
+            if n is not None:
+                sizes[rel][suffix] = n
+    return {"manifest": manifest, "sizes": sizes}
+
+
+def _state():
+    return current_app.extensions["assets"]
+
+
+def asset_url(filename, **values):
+    """مثل url_for('static', filename=...) بس يرجع الرابط اللي بي hash."""
+    mapped = _state()["manifest"].get(filename, filename)
+    return url_for("static", filename=mapped, **values)
+
+
+def _accepted_encoding(path):
+    for enc, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[enc] and os.path.exists(path + suffix):
+            return enc, suffix
+    return None, ""
+
+
+def _immutable(resp):
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+def serve_static(filename):
+    """بديل view مال /static: الروابط اللي بي hash + uploads => immutable، والباقي مثل Flask."""
+    app = current_app
+    original = _state()["reverse"].get(filename)
+
+    if original:
+        enc, suffix = _accepted_encoding(os.path.join(app.static_folder, original))
+        resp = send_from_directory(
+            app.static_folder, original + suffix,
+            mimetype=mimetypes.guess_type(original)[0],
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+        if enc:
+            resp.headers["Content-Encoding"] = enc
+        resp.vary.add("Accept-Encoding")
+        return _immutable(resp)
+
+    if filename.startswith("uploads/"):
+        resp = send_from_directory(app.static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+        return _immutable(resp)
+
+    return app.send_static_file(filename)
+
+
+def page_report(app, result):
+    """كم byte نوفر بكل صفحة (template) بأول زيارة بفضل gzip/br."""
+    rows = []
+    for name in sorted(app.jinja_env.list_templates()):
+        source = app.jinja_env.loader.get_source(app.jinja_env, name)[0]
+        refs = sorted(set(_TEMPLATE_ASSET_RE.findall(source)))
+        if not refs:
+            continue
+        raw = gz = br = 0
+        for rel in refs:
+            s = result["sizes"].get(rel, {})
+            raw += s.get("raw", 0)
+            gz += s.get(".gz", s.get("raw", 0))
+            br += s.get(".br", s.get(".gz", s.get("raw", 0)))
+        rows.append({"template": name, "assets": refs, "raw": raw, "gzip": gz, "br": br})
+    return rows
+
+
+def init_app(app):
+    """
+    يبني الـ manifest (و .gz/.br إذا static قابل للكتابة) ويبدل view مال /static.
+    ASSETS_PRECOMPRESS=0 => ما نكتب شي وقت التشغيل (نعتمد على build-assets بالـ deploy).
+    """
+    compress = os.getenv("ASSETS_PRECOMPRESS", "1") == "1"
+    try:
+        result = build(app.static_folder, compress=compress)
+    except OSError:
+        result = build(app.static_folder, compress=False)
+
+    app.extensions["assets"] = {
+        "manifest": result["manifest"],
+        "reverse": {v: k for k, v in result["manifest"].items()},
+        "sizes": result["sizes"],
+    }
+    app.view_functions["static"] = serve_static
+    app.add_template_global(asset_url)
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """يبني .gz/.br للـ static ويطبع التوفير لكل صفحة (flask --app app build-assets)."""
+        result = build(app.static_folder)
+        for rel, s in sorted(result["sizes"].items()):
+            if len(s) > 1:
+                extra = " ".join(f"{k[1:]}={v}" for k, v in s.items() if k != "raw")
+                click.echo(f"{result['manifest'][rel]}: raw={s['raw']} {extra}")
+        if not brotli_available():
+            click.echo("(brotli مو منصب => gzip بس)")
+
+        click.echo("")
+        for row in page_report(app, result):
+            click.echo(
+                f"{row['template']}: {row['raw']} -> gzip {row['gzip']} / br {row['br']} bytes "
+                f"(نوفر {row['raw'] - row['br']} بأول زيارة، والزيارات بعدها من الكاش بدون طلب)"
+            )
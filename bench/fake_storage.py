@@ -0,0 +1,113 @@
+"""
+بديل محلي لـ Supabase Storage (للتجربة والـ benchmarks بدون شبكة):
+
+    python -m bench.fake_storage --port 54321 [--fail-rate 0.2] [--delay 0.1]
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_ROLE_KEY=x flask run
+
+الملفات تنحفظ بالذاكرة. --fail-rate يرجع 503 عشوائياً حتى نجرب الـ retry والطابور.
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "/storage/v1/object/"
+PUBLIC_PREFIX = "/storage/v1/object/public/"
+
+
+class FakeStorage:
+    def __init__(self, fail_rate=0.0, delay=0.0):
+        self.objects = {}
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _handler(store):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, code, body=b"", content_type="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _begin(self):
+            with store.lock:
+                store.requests += 1
+            if store.delay:
+                time.sleep(store.delay)
+            if store.fail_rate and random.random() < store.fail_rate:
+                self._reply(503, b'{"error":"unavailable"}')
+                return False
+            return True
+
+        def _read_body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(n) if n else b""
+
+        def do_GET(self):
+            if not self._begin():
+                return
+            if not self.path.startswith(PUBLIC_PREFIX):
+                return self._reply(404, b'{"error":"not_found"}')
+            obj = store.objects.get(self.path[len(PUBLIC_PREFIX):])
+            if obj is None:
+                return self._reply(404, b'{"error":"not_found"}')
+            self._reply(200, obj[0], obj[1])
+
+        def do_POST(self):
+            data = self._read_body()
+            if not self._begin():
+                return
+            if not self.path.startswith(PREFIX):
+                return self._reply(404, b'{"error":"not_found"}')
+            ctype = self.headers.get("Content-Type", "application/octet-stream")
+            store.objects[self.path[len(PREFIX):]] = (data, ctype)
+            self._reply(200, b'{"Key":"ok"}')
+
+        do_PUT = do_POST
+
+        def do_DELETE(self):
+            if not self._begin():
+                return
+            path = self.path[len(PREFIX):]
+            if store.objects.pop(path, None) is None:
+                return self._reply(400, b'{"statusCode":"404","error":"not_found"}')
+            self._reply(200, b'{"message":"deleted"}')
+
+    return Handler
+
+
+def start(port=0, fail_rate=0.0, delay=0.0):
+    """يشغل السيرفر بـ thread ويرجع (server, store). server.server_port = البورت الفعلي."""
+    store = FakeStorage(fail_rate, delay)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(store))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=54321)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--delay", type=float, default=0.0)
+    args = ap.parse_args()
+
+    server, _ = start(args.port, args.fail_rate, args.delay)
+    print(f"fake storage on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
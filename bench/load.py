@@ -0,0 +1,312 @@
+"""
+Benchmark للـ routes الحارة: يزرع بيانات وهمية بالحجم اللي تريده، ويضرب الـ app الحقيقي
+بعدة threads، ويطلع p50/p95/p99 + requests/sec + عدد الـ queries لكل request.
+
+التشغيل (من جذر المشروع):
+    python -m bench.load                                   # SQLite مؤقت، الحجم الافتراضي
+    python -m bench.load --techs 20000 --points-tx 200000 --concurrency 16
+    python -m bench.load --server                          # عبر WSGI server محلي بدل test client
+    python -m bench.load --json after.json --compare before.json
+    DATABASE_URL=postgresql://... python -m bench.load     # قاعدة تجربة فقط! (البيانات تنزرع وتبقى)
+
+PAGE_CACHE=0 يطفي كاش الصفحات العامة حتى تقيس الـ render الفعلي لـ /winners.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import db
+
+ROUTES = ("winners", "gifts", "me", "user_redeem", "admin_points_add", "admin_dashboard", "admin_winners")
+ADMIN = {"email": "admin@example.com", "password": "123456"}
+
+
+# ========= عد الـ queries (db.request_db_stats) =========
+_query_counts = {}
+_query_lock = threading.Lock()
+
+
+def _install_query_counter(app):
+    @app.teardown_request
+    def _record_queries(exc):
+        from flask import request
+        stats = db.request_db_stats()
+        with _query_lock:
+            total, reqs = _query_counts.get(request.endpoint, (0, 0))
+            _query_counts[request.endpoint] = (total + (stats["count"] if stats else 0), reqs + 1)
+
+
+# ========= البيانات =========
+def seed(techs, gifts, points_tx, redemptions, batch=2000):
+    """يزرع بيانات بأسماء bench-<run>-... ويرجع {"tech_ids": [...], "gift_ids": [...], "run": ...}."""
+    run = f"{int(time.time()) % 100000}{random.randint(10, 99)}"
+    rnd = random.Random(run)
+    stamp = db.now()
+    con = db.connect()
+
+    tech_rows = [
+        (f"bench tech {i}", f"bench-{run}-{i}", "pw", "كهرباء", 10_000_000, stamp)
+        for i in range(techs)
+    ]
+    for i in range(0, len(tech_rows), batch):
+        db.insert_many(con, "technicians", ("name", "phone", "password", "specialty", "points", "created_at"),
+                       tech_rows[i:i + batch])
+    gift_rows = [(f"bench gift {run}-{i}", rnd.randint(5, 500), None, 1, stamp) for i in range(gifts)]
+    db.insert_many(con, "gifts", ("name", "points_required", "image_filename", "is_active", "created_at"), gift_rows)
+    con.commit()
+
+    tech_ids = [r["id"] for r in con.execute(
+        "SELECT id FROM technicians WHERE phone LIKE ? ORDER BY id", (f"bench-{run}-%",)
+    ).fetchall()]
+    gifts_db = con.execute(
+        "SELECT id, points_required FROM gifts WHERE name LIKE ? ORDER BY id", (f"bench gift {run}-%",)
+    ).fetchall()
+    gift_ids = [g["id"] for g in gifts_db]
+    gift_cost = {g["id"]: g["points_required"] for g in gifts_db}
+
+    # نقاط موزعة على آخر 60 يوم => الأسبوع/الشهر فيهم بيانات حقيقية
+    today = datetime.now()
+    for i in range(0, points_tx, batch):
+        rows = []
+        per_day = {}
+        for _ in range(min(batch, points_tx - i)):
+            tech_id = rnd.choice(tech_ids)
+            when = today - timedelta(days=rnd.randint(0, 59), seconds=rnd.randint(0, 86399))
+            amount = rnd.randint(1, 50) * 10000
+            points = amount // 10000
+            rows.append((tech_id, amount, points, db.now(when), db.timestamp(when), 1))
+            day = per_day.setdefault(when.date(), {})
+            day[tech_id] = day.get(tech_id, 0) + points
+        db.insert_many(con, "points_tx",
+                       ("tech_id", "purchase_amount", "points_added", "created_at", "created_ts", "admin_id"), rows)
+        for day, tech_points in per_day.items():
+            db.add_leaderboard_points_many(
+                con, list(tech_points.items()), when=datetime.combine(day, datetime.min.time())
+            )
+        con.commit()
+
+    for i in range(0, redemptions, batch):
+        rows = []
+        for _ in range(min(batch, redemptions - i)):
+            gift_id = rnd.choice(gift_ids)
+            when = today - timedelta(days=rnd.randint(0, 59), seconds=rnd.randint(0, 86399))
+            rows.append((rnd.choice(tech_ids), gift_id, gift_cost[gift_id], db.now(when), db.timestamp(when),
+                         rnd.choice(("pending", "delivered"))))
+        db.insert_many(con, "redemptions",
+                       ("tech_id", "gift_id", "points_spent", "created_at", "created_ts", "status"), rows)
+        con.commit()
+    con.close()
+
+    db.rebuild_counters()
+    db.invalidate_leaderboards()
+    return {"tech_ids": tech_ids, "gift_ids": gift_ids, "run": run}
+
+
+# ========= العملاء =========
+class _Client:
+    """نفس الواجهة لـ test client و requests (--server)."""
+
+    def __init__(self, app, base_url=None):
+        if base_url:
+            import requests
+            self._s = requests.Session()
+            self._base = base_url
+        else:
+            self._c = app.test_client()
+            self._base = None
+
+    def request(self, method, path, data=None):
+        if self._base:
+            r = self._s.request(method, self._base + path, data=data, allow_redirects=False)
+            return r.status_code
+        return self._c.open(path, method=method, data=data).status_code
+
+
+def _make_clients(app, n, data, base_url):
+    """لكل thread: فني مسجل دخول + أدمن مسجل دخول."""
+    clients = []
+    for i in range(n):
+        tech = _Client(app, base_url)
+        tech.request("POST", "/login", {"phone": f"bench-{data['run']}-{i % len(data['tech_ids'])}", "password": "pw"})
+        admin = _Client(app, base_url)
+        admin.request("POST", "/admin/login", ADMIN)
+        clients.append((tech, admin))
+    return clients
+
+
+def _route_call(route, tech, admin, data, rnd):
+    if route == "winners":
+        return tech.request("GET", "/winners?period=" + rnd.choice(("", "week", "month", "all")))
+    if route == "gifts":
+        return tech.request("GET", "/gifts")
+    if route == "me":
+        return tech.request("GET", "/me")
+    if route == "user_redeem":
+        return tech.request("POST", f"/gifts/{rnd.choice(data['gift_ids'])}/redeem")
+    if route == "admin_points_add":
+        return admin.request("POST", "/admin/points/add", {"tech_id": rnd.choice(data["tech_ids"]), "amount": "50000"})
+    if route == "admin_dashboard":
+        return admin.request("GET", "/admin")
+    if route == "admin_winners":
+        return admin.request("GET", "/admin/winners?status=" + rnd.choice(("pending", "delivered")))
+    raise ValueError(route)
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def bench_route(route, clients, data, total, endpoint):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    per_thread = [total // len(clients) + (1 if i < total % len(clients) else 0) for i in range(len(clients))]
+    before = _query_counts.get(endpoint, (0, 0))
+    start = threading.Barrier(len(clients))
+
+    def worker(i):
+        tech, admin = clients[i]
+        rnd = random.Random(i)
+        mine = []
+        mine_status = {}
+        start.wait()
+        for _ in range(per_thread[i]):
+            t0 = time.perf_counter()
+            status = _route_call(route, tech, admin, data, rnd)
+            mine.append((time.perf_counter() - t0) * 1000)
+            mine_status[status] = mine_status.get(status, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            for k, v in mine_status.items():
+                statuses[k] = statuses.get(k, 0) + v
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(clients))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    after = _query_counts.get(endpoint, (0, 0))
+    reqs = after[1] - before[1]
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_pct(latencies, 95), 2),
+        "p99_ms": round(_pct(latencies, 99), 2),
+        "queries_per_request": round((after[0] - before[0]) / reqs, 2) if reqs else None,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return None
+
+
+def _print_compare(report, baseline):
+    meta = baseline["meta"]
+    print(f"\nvs {meta.get('git_rev')} ({meta.get('backend')}, {meta.get('mode')}, concurrency {meta.get('concurrency')}):")
+    for route, r in report["routes"].items():
+        b = baseline["routes"].get(route)
+        if not b:
+            continue
+
+        def delta(key):
+            return f"{(r[key] - b[key]) / b[key] * 100:+.0f}%" if b[key] else "n/a"
+        print(f"{route:>18}: p50 {delta('p50_ms'):>6}  p95 {delta('p95_ms'):>6}  rps {delta('rps'):>6}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--techs", type=int, default=2000)
+    ap.add_argument("--gifts", type=int, default=50)
+    ap.add_argument("--points-tx", type=int, default=20000)
+    ap.add_argument("--redemptions", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=400, help="لكل route")
+    ap.add_argument("--routes", default=",".join(ROUTES))
+    ap.add_argument("--server", action="store_true", help="WSGI server محلي (threaded) بدل test client")
+    ap.add_argument("--json", metavar="PATH")
+    ap.add_argument("--compare", metavar="PATH", help="نتيجة سابقة (--json) للمقارنة")
+    args = ap.parse_args(argv)
+
+    os.environ.setdefault("STORAGE_WORKER", "0")
+    os.environ.setdefault("ASSETS_PRECOMPRESS", "0")
+    if not db._is_postgres():
+        # ما نلمس app.db الحقيقي
+        db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench-load-"), "load.db")
+
+    import app as webapp
+    webapp.bootstrap()
+    _install_query_counter(webapp.app)
+
+    t0 = time.perf_counter()
+    data = seed(args.techs, args.gifts, args.points_tx, args.redemptions)
+    seed_seconds = time.perf_counter() - t0
+
+    server = None
+    base_url = None
+    if args.server:
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class _QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        server = make_server("127.0.0.1", 0, webapp.app, threaded=True, request_handler=_QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+    clients = _make_clients(webapp.app, args.concurrency, data, base_url)
+    report = {
+        "meta": {
+            "backend": "postgres" if db._is_postgres() else "sqlite",
+            "mode": "server" if args.server else "test_client",
+            "git_rev": _git_rev(),
+            "at": db.now(),
+            "scale": {"techs": args.techs, "gifts": args.gifts, "points_tx": args.points_tx,
+                      "redemptions": args.redemptions},
+            "concurrency": args.concurrency,
+            "seed_seconds": round(seed_seconds, 2),
+            "page_cache": os.getenv("PAGE_CACHE", "1") == "1",
+        },
+        "routes": {},
+    }
+
+    print(f"{'route':>18} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'q/req':>6}  statuses")
+    for route in [r.strip() for r in args.routes.split(",") if r.strip()]:
+        endpoint = {"winners": "winners", "gifts": "user_gifts", "me": "user_dashboard"}.get(route, route)
+        r = bench_route(route, clients, data, args.requests, endpoint)
+        report["routes"][route] = r
+        print(f"{route:>18} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r['queries_per_request'] if r['queries_per_request'] is not None else '-':>6}  {r['statuses']}")
+
+    if server:
+        server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as f:
+            _print_compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+كتابات متزامنة على SQLite: عدة processes (مثل workers مال gunicorn) يضيفون نقاط بنفس الوقت.
+كل transaction = نفس اللي يسويه admin_points_add (UPDATE + points_tx + counters + leaderboard + versions).
+
+نقارن SQLITE_PROFILE=legacy (rollback journal, synchronous=FULL) مع production (WAL + pragmas)،
+كل profile على DB جديدة بملف مؤقت (WAL يبقى محفوظ بالملف).
+
+التشغيل (من جذر المشروع):
+    python -m bench.sqlite_writes
+    python -m bench.sqlite_writes --workers 8 --tx 300 --readers 2
+    python -m bench.sqlite_writes --profiles production --json out.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# writer: يطبع {"ok", "locked", "latencies_ms"}
+_WRITER = r"""
+import json, random, sqlite3, sys, time
+import db
+db.DB_PATH = sys.argv[1]
+n_tx, techs, start_at = int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4])
+rnd = random.Random()
+lat, locked = [], 0
+while time.time() < start_at:
+    time.sleep(0.001)
+for _ in range(n_tx):
+    tech_id = rnd.randint(1, techs)
+    points = rnd.randint(1, 20)
+    t0 = time.perf_counter()
+    con = db.connect()
+    try:
+        con.execute("UPDATE technicians SET points = points + ? WHERE id=?", (points, tech_id))
+        con.execute(
+            "INSERT INTO points_tx(tech_id, purchase_amount, points_added, created_at, created_ts, admin_id) "
+            "VALUES (?,?,?,?,?,?)",
+            (tech_id, points * 10000, points, *db.ledger_now(), 1),
+        )
+        db.bump_counter(con, "points_total", points)
+        db.add_leaderboard_points(con, tech_id, points)
+        db.bump_versions(con, [db.tech_scope(tech_id)])
+        con.commit()
+        lat.append((time.perf_counter() - t0) * 1000)
+    except sqlite3.OperationalError as e:
+        con.rollback()
+        if "locked" not in str(e) and "busy" not in str(e):
+            raise
+        locked += 1
+    finally:
+        con.close()
+print(json.dumps({"ok": len(lat), "locked": locked, "latencies_ms": lat}))
+"""
+
+# reader: صفحة الرابحين + رصيد فني، لحد ما يخلصون الكتّاب
+_READER = r"""
+import json, os, random, sqlite3, sys, time
+import db
+db.DB_PATH = sys.argv[1]
+techs, start_at, stop_file = int(sys.argv[2]), float(sys.argv[3]), sys.argv[4]
+rnd = random.Random()
+n, locked = 0, 0
+while time.time() < start_at:
+    time.sleep(0.001)
+while not os.path.exists(stop_file):
+    con = db.connect()
+    try:
+        con.execute("SELECT id, name, points FROM technicians ORDER BY points DESC LIMIT 20").fetchall()
+        con.execute("SELECT points FROM technicians WHERE id=?", (rnd.randint(1, techs),)).fetchone()
+        n += 1
+    except sqlite3.OperationalError:
+        locked += 1
+    finally:
+        con.close()
+print(json.dumps({"reads": n, "locked": locked}))
+"""
+
+
+def _env(profile):
+    return dict(os.environ, PYTHONPATH=ROOT, SQLITE_PROFILE=profile, DATABASE_URL="")
+
+
+def _seed(db_path, profile, techs):
+    code = (
+        "import sys, db; db.DB_PATH = sys.argv[1]; db.init_db(); con = db.connect();"
+        "con.executemany('INSERT INTO technicians(name, phone, password, points, created_at) VALUES (?,?,?,0,?)',"
+        " [(f'bench-{i}', f'0780{i:07d}', 'x', db.now()) for i in range(int(sys.argv[2]))]);"
+        "con.commit(); con.close()"
+    )
+    subprocess.run([sys.executable, "-c", code, db_path, str(techs)], cwd=ROOT, env=_env(profile), check=True)
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(profile, workers, n_tx, readers, techs):
+    tmp = tempfile.mkdtemp(prefix=f"bench-sqlite-{profile}-")
+    db_path = os.path.join(tmp, "bench.db")
+    stop_file = os.path.join(tmp, "stop")
+    _seed(db_path, profile, techs)
+
+    start_at = time.time() + 1.0  # كلهم يبدون سوا بعد ما يخلص الـ import
+    env = _env(profile)
+    writers = [
+        subprocess.Popen(
+            [sys.executable, "-c", _WRITER, db_path, str(n_tx), str(techs), str(start_at)],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True,
+        )
+        for _ in range(workers)
+    ]
+    reader_procs = [
+        subprocess.Popen(
+            [sys.executable, "-c", _READER, db_path, str(techs), str(start_at), stop_file],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True,
+        )
+        for _ in range(readers)
+    ]
+
+    results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in writers]
+    elapsed = time.time() - start_at
+    open(stop_file, "w").close()
+    read_results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in reader_procs]
+
+    lat = [x for r in results for x in r["latencies_ms"]]
+    ok = sum(r["ok"] for r in results)
+    return {
+        "profile": profile,
+        "workers": workers,
+        "tx_per_worker": n_tx,
+        "committed": ok,
+        "locked_errors": sum(r["locked"] for r in results),
+        "tx_per_sec": round(ok / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": round(statistics.median(lat), 2) if lat else None,
+        "p95_ms": round(_pct(lat, 95), 2) if lat else None,
+        "p99_ms": round(_pct(lat, 99), 2) if lat else None,
+        "reads": sum(r["reads"] for r in read_results),
+        "read_locked_errors": sum(r["locked"] for r in read_results),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--tx", type=int, default=200, help="transactions لكل worker")
+    ap.add_argument("--readers", type=int, default=1, help="processes تقرا بنفس الوقت")
+    ap.add_argument("--techs", type=int, default=200)
+    ap.add_argument("--profiles", default="legacy,production")
+    ap.add_argument("--json", metavar="PATH")
+    args = ap.parse_args(argv)
+
+    reports = [run(p.strip(), args.workers, args.tx, args.readers, args.techs) for p in args.profiles.split(",")]
+
+    cols = ("profile", "tx_per_sec", "p50_ms", "p95_ms", "p99_ms", "committed", "locked_errors", "reads", "read_locked_errors")
+    print("  ".join(f"{c:>18}" for c in cols))
+    for r in reports:
+        print("  ".join(f"{str(r[c]):>18}" for c in cols))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+وقت الإقلاع: كم ياخذ worker جديد (gunicorn respawn / autoscaling) لحد ما يرد أول request.
+
+كل مرة interpreter جديد:
+    import_ms         = import app (بدون DB)
+    first_request_ms  = أول GET / (يشمل الـ bootstrap إذا APP_BOOTSTRAPPED مو 1)
+
+التشغيل (من جذر المشروع):
+    python -m bench.startup                  # SQLite مؤقت
+    python -m bench.startup --bootstrapped   # مثل worker تحت gunicorn.conf.py
+    python -m bench.startup --importtime     # أثقل الموديولات (python -X importtime)
+    python -m bench.startup --json out.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app, db
+t1 = time.perf_counter()
+if sys.argv[1]:
+    db.DB_PATH = sys.argv[1]
+r = app.app.test_client().get("/")
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_request_ms": (t2 - t1) * 1000, "status": r.status_code}))
+"""
+
+
+def _env(bootstrapped):
+    env = dict(os.environ, PYTHONPATH=ROOT, STORAGE_WORKER="0", ASSETS_PRECOMPRESS="0")
+    if bootstrapped:
+        env["APP_BOOTSTRAPPED"] = "1"
+    else:
+        env.pop("APP_BOOTSTRAPPED", None)
+    return env
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def measure(runs, bootstrapped):
+    db_path = ""
+    if not os.getenv("DATABASE_URL"):
+        db_path = os.path.join(tempfile.mkdtemp(prefix="bench-startup-"), "startup.db")
+        if bootstrapped:
+            # worker تحت gunicorn: الـ schema جاهز من الـ master
+            subprocess.run(
+                [sys.executable, "-c", "import sys, app, db; db.DB_PATH = sys.argv[1]; app.bootstrap()", db_path],
+                cwd=ROOT, env=_env(False), check=True, capture_output=True,
+            )
+
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _CHILD, db_path],
+            cwd=ROOT, env=_env(bootstrapped), check=True, capture_output=True, text=True,
+        ).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+
+    report = {"runs": runs, "bootstrapped": bootstrapped, "backend": "postgres" if db_path == "" else "sqlite"}
+    for key in ("import_ms", "first_request_ms"):
+        vals = [s[key] for s in samples]
+        report[key] = {
+            "p50": round(statistics.median(vals), 1),
+            "p95": round(_pct(vals, 95), 1),
+            "min": round(min(vals), 1),
+        }
+    report["statuses"] = sorted({s["status"] for s in samples})
+    return report
+
+
+def importtime(top):
+    """اللي يستورده app مباشرة (وأولادهم)، مرتبين حسب الوقت التراكمي (us)."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, env=_env(True), capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            rows.append((int(cum_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--bootstrapped", action="store_true", help="APP_BOOTSTRAPPED=1 مثل workers تحت gunicorn")
+    ap.add_argument("--importtime", type=int, nargs="?", const=15, metavar="TOP")
+    ap.add_argument("--json", metavar="PATH")
+    args = ap.parse_args(argv)
+
+    report = measure(args.runs, args.bootstrapped)
+    for k, v in report.items():
+        print(f"{k:>18}: {v}")
+
+    if args.importtime:
+        print()
+        report["importtime"] = []
+        for cum_us, name in importtime(args.importtime):
+            print(f"{cum_us / 1000:>9.1f} ms  {name}")
+            report["importtime"].append({"module": name, "cumulative_ms": round(cum_us / 1000, 1)})
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Stress test لمسار استبدال الهدايا.
+
+عدة threads يحاولون يستبدلون نفس الهدية لنفس الفني بنفس الوقت،
+وبالنهاية نتأكد ان الرصيد ما صار سالب وان عدد الطلبات = عدد الخصومات.
+
+التشغيل (من جذر المشروع):
+    python -m bench.stress_redeem                 # SQLite مؤقت
+    DATABASE_URL=postgresql://... python -m bench.stress_redeem   # قاعدة تجربة فقط!
+
+--legacy يشغل الطريقة القديمة (SELECT ثم فحص بالبايثون ثم UPDATE) للمقارنة.
+بين الفحص والـ UPDATE ننام --gap-ms (مثل وقت الـ request الحقيقي بينهم)، وإلا الـ threads
+نادراً يتداخلون والسباق ما يبين. redeem_gift ما عنده فجوة أصلاً: الفحص داخل الـ UPDATE.
+"""
+import argparse
+import functools
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import db
+
+
+class _CountingConn:
+    """يحسب كل round trip (execute / commit / rollback) على الاتصال."""
+
+    def __init__(self, con, counter):
+        self._con = con
+        self._counter = counter
+
+    def _hit(self):
+        self._counter.n = getattr(self._counter, "n", 0) + 1
+
+    def execute(self, *args, **kwargs):
+        self._hit()
+        return self._con.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._hit()
+        return self._con.executemany(*args, **kwargs)
+
+    def execute_values(self, *args, **kwargs):
+        self._hit()
+        return self._con.execute_values(*args, **kwargs)
+
+    def commit(self):
+        self._hit()
+        return self._con.commit()
+
+    def rollback(self):
+        self._hit()
+        return self._con.rollback()
+
+    def close(self):
+        return self._con.close()
+
+
+def _legacy_redeem(tech_id, gift_id, gap=0.0):
+    # نفس خطوات user_redeem قبل redeem_gift
+    con = db.connect()
+    user = con.execute("SELECT id,points FROM technicians WHERE id=?", (tech_id,)).fetchone()
+    gift = con.execute("SELECT * FROM gifts WHERE id=? AND is_active=1", (gift_id,)).fetchone()
+    if not gift or not user:
+        con.close()
+        return db.REDEEM_NOT_FOUND, None
+    if user["points"] < gift["points_required"]:
+        con.close()
+        return db.REDEEM_INSUFFICIENT, None
+    if gap:
+        # الرصيد اللي فحصناه ممكن يتغير هنا
+        time.sleep(gap)
+    con.execute("UPDATE technicians SET points = points - ? WHERE id=?", (gift["points_required"], user["id"]))
+    con.execute("""
+        INSERT INTO redemptions(tech_id, gift_id, points_spent, created_at, status)
+        VALUES (?,?,?,?,?)
+    """, (user["id"], gift["id"], gift["points_required"], db.now(), "pending"))
+    con.commit()
+    new_points = con.execute("SELECT points FROM technicians WHERE id=?", (user["id"],)).fetchone()["points"]
+    con.close()
+    return db.REDEEM_OK, new_points
+
+
+def _seed(balance, cost):
+    con = db.connect()
+    stamp = f"stress-{os.getpid()}-{int(time.time() * 1000)}"
+    con.execute("""
+        INSERT INTO technicians(name, phone, password, specialty, points, created_at)
+        VALUES (?,?,?,?,?,?)
+    """, (stamp, stamp, "x", "", balance, db.now()))
+    con.execute("""
+        INSERT INTO gifts(name, points_required, image_filename, is_active, created_at)
+        VALUES (?,?,?,?,?)
+    """, (stamp, cost, None, 1, db.now()))
+    con.commit()
+    tech_id = con.execute("SELECT id FROM technicians WHERE phone=?", (stamp,)).fetchone()["id"]
+    gift_id = con.execute("SELECT id FROM gifts WHERE name=?", (stamp,)).fetchone()["id"]
+    con.close()
+    return tech_id, gift_id
+
+
+def _cleanup(tech_id, gift_id):
+    con = db.connect()
+    con.execute("DELETE FROM redemptions WHERE tech_id=?", (tech_id,))
+    con.execute("DELETE FROM technicians WHERE id=?", (tech_id,))
+    con.execute("DELETE FROM gifts WHERE id=?", (gift_id,))
+    con.commit()
+    con.close()
+
+
+def run(threads=16, attempts=20, balance=1000, cost=70, legacy=False, gap_ms=5):
+    tech_id, gift_id = _seed(balance, cost)
+    redeem = functools.partial(_legacy_redeem, gap=gap_ms / 1000) if legacy else db.redeem_gift
+
+    counter = threading.local()
+    real_connect = db.connect
+    db.connect = lambda: _CountingConn(real_connect(), counter)
+
+    results = {db.REDEEM_OK: 0, db.REDEEM_INSUFFICIENT: 0, db.REDEEM_NOT_FOUND: 0, "error": 0}
+    trips = {status: 0 for status in results}
+    results_lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        for _ in range(attempts):
+            counter.n = 0
+            try:
+                status, _ = redeem(tech_id, gift_id)
+            except Exception:
+                status = "error"
+            with results_lock:
+                results[status] += 1
+                trips[status] += counter.n
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    db.connect = real_connect
+
+    con = db.connect()
+    final = con.execute("SELECT points FROM technicians WHERE id=?", (tech_id,)).fetchone()["points"]
+    row = con.execute(
+        "SELECT COUNT(*) AS n, COALESCE(SUM(points_spent),0) AS spent FROM redemptions WHERE tech_id=?",
+        (tech_id,)
+    ).fetchone()
+    con.close()
+    _cleanup(tech_id, gift_id)
+
+    ok = results[db.REDEEM_OK]
+    report = {
+        "mode": f"legacy (gap {gap_ms}ms)" if legacy else "redeem_gift",
+        "backend": "postgres" if db._is_postgres() else "sqlite",
+        "attempts": threads * attempts,
+        "results": results,
+        "final_points": final,
+        "redemptions": row["n"],
+        "points_spent": row["spent"],
+        "expected_max_redemptions": balance // cost,
+        "round_trips_per_success": round(trips[db.REDEEM_OK] / ok, 2) if ok else None,
+        "round_trips_per_rejection": (
+            round(trips[db.REDEEM_INSUFFICIENT] / results[db.REDEEM_INSUFFICIENT], 2)
+            if results[db.REDEEM_INSUFFICIENT] else None
+        ),
+        "seconds": round(elapsed, 3),
+    }
+    report["double_spend"] = (
+        final < 0
+        or row["n"] > balance // cost
+        or final != balance - row["spent"]
+    )
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--attempts", type=int, default=20)
+    ap.add_argument("--balance", type=int, default=1000)
+    ap.add_argument("--cost", type=int, default=70)
+    ap.add_argument("--legacy", action="store_true")
+    ap.add_argument("--gap-ms", type=float, default=5, help="نوم بين الفحص والـ UPDATE بالـ legacy")
+    args = ap.parse_args(argv)
+
+    if not db._is_postgres():
+        # ما نلمس app.db الحقيقي
+        db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="stress-redeem-"), "stress.db")
+    db.init_db()
+
+    report = run(args.threads, args.attempts, args.balance, args.cost, args.legacy, args.gap_ms)
+    for k, v in report.items():
+        print(f"{k:>26}: {v}")
+    return 1 if report["double_spend"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+استيراد CSV بالجملة:
+- نقاط:  phone, purchase_amount  (مثل admin_points_add بس لآلاف الفواتير)
+- فنيين: name, phone, password, specialty
+
+الملف ينقرا سطر سطر (بدون ما نحمله كله بالذاكرة)، وكل IMPORT_BATCH_SIZE سطر
+ينطبق بـ transaction وحدة. السطر الغلط ما يوقف الاستيراد، ينكتب بتقرير الأخطاء.
+"""
+import csv
+import io
+import os
+
+import db
+import page_cache
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# نعرض أول هذا العدد من الأخطاء بس (العدد الكلي ينحسب دائماً)
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.applied = 0
+        self.points = 0
+        self.batches = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, row, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "row": ",".join(row), "error": message})
+
+
+def _read_rows(fileobj):
+    """يرجع (رقم السطر, الأعمدة) ويتخطى الأسطر الفارغة."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        reader = csv.reader(text)
+        for row in reader:
+            cells = [c.strip() for c in row]
+            if any(cells):
+                yield reader.line_num, cells
+    finally:
+        # ما نسكر ملف الـ request نفسه
+        text.detach()
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_int(value):
+    # يقبل 1,000,000 و الأرقام العربية (int يفهمها)
+    return int(value.replace(",", "").replace("،", "").replace(" ", ""))
+
+
+def _is_header(cells, numeric_col):
+    # أول سطر إذا العمود الرقمي مو رقم => عناوين
+    try:
+        _parse_int(cells[numeric_col])
+        return False
+    except (IndexError, ValueError):
+        return True
+
+
+# ========= Points =========
+def import_points(fileobj, admin_id, batch_size=IMPORT_BATCH_SIZE):
+    report = ImportReport("points")
+    iqd_per_point = int(db.get_setting("iqd_per_point", "10000"))
+
+    def valid_rows():
+        first = True
+        for line, cells in _read_rows(fileobj):
+            if first:
+                first = False
+                if _is_header(cells, 1):
+                    continue
+            if len(cells) < 2 or not cells[0]:
+                report.error(line, cells, "لازم عمودين: رقم الهاتف، المبلغ")
+                continue
+            try:
+                amount = _parse_int(cells[1])
+            except ValueError:
+                report.error(line, cells, "المبلغ مو رقم")
+                continue
+            if amount <= 0:
+                report.error(line, cells, "المبلغ لازم أكبر من صفر")
+                continue
+            yield line, cells, cells[0], amount
+
+    for batch in _batches(valid_rows(), batch_size):
+        _apply_points_batch(batch, admin_id, iqd_per_point, report)
+
+    db.invalidate_leaderboards()
+    page_cache.invalidate("winners")
+    return report
+
+
+def _apply_points_batch(batch, admin_id, iqd_per_point, report):
+    con = db.connect()
+    try:
+        ids = db.technician_ids_by_phone(con, [phone for _, _, phone, _ in batch])
+        stamp, stamp_ts = db.ledger_now()
+        tx_rows = []
+        per_tech = {}
+        skipped = []
+        for line, cells, phone, amount in batch:
+            tech_id = ids.get(phone)
+            if tech_id is None:
+                skipped.append((line, cells, "رقم الهاتف غير موجود"))
+                continue
+            points = max(1, amount // iqd_per_point)
+            tx_rows.append((tech_id, amount, points, stamp, stamp_ts, admin_id))
+            per_tech[tech_id] = per_tech.get(tech_id, 0) + points
+
+        if tx_rows:
+            total = sum(per_tech.values())
+            db.insert_many(
+                con, "points_tx",
+                ("tech_id", "purchase_amount", "points_added", "created_at", "created_ts", "admin_id"),
+                tx_rows
+            )
+            db.add_points_many(con, list(per_tech.items()))
+            db.add_leaderboard_points_many(con, list(per_tech.items()))
+            db.bump_versions(con, [db.tech_scope(t) for t in per_tech])
+            db.bump_counter(con, "points_total", total)
+        con.commit()
+    except Exception as e:
+        con.rollback()
+        for line, cells, _, _ in batch:
+            report.error(line, cells, f"فشل تطبيق الدفعة: {e}")
+        return
+    finally:
+        con.close()
+
+    for err in skipped:
+        report.error(*err)
+    report.batches += 1
+    report.applied += len(tx_rows)
+    report.points += sum(per_tech.values())
+
+
+# ========= Technicians roster =========
+def import_technicians(fileobj, batch_size=IMPORT_BATCH_SIZE):
+    report = ImportReport("techs")
+    seen = set()
+
+    def valid_rows():
+        first = True
+        for line, cells in _read_rows(fileobj):
+            cells = (cells + ["", "", "", ""])[:4]
+            name, phone, password, specialty = cells
+            if first:
+                first = False
+                if not any(ch.isdigit() for ch in phone):
+                    continue
+            if not (name and phone and password):
+                report.error(line, cells, "يرجى ملء الاسم + رقم الهاتف + كلمة السر")
+                continue
+            if phone in seen:
+                report.error(line, cells, "رقم الهاتف مكرر داخل الملف")
+                continue
+            seen.add(phone)
+            yield line, cells, (name, phone, password, specialty)
+
+    for batch in _batches(valid_rows(), batch_size):
+        _apply_techs_batch(batch, report)
+
+    # مثل import_points: الفنيين الجدد يبينون بالـ leaderboards و /winners بدون انتظار الـ TTL
+    db.invalidate_leaderboards()
+    page_cache.invalidate("winners")
+    return report
+
+
+def _apply_techs_batch(batch, report):
+    con = db.connect()
+    try:
+        existing = db.technician_ids_by_phone(con, [tech[1] for _, _, tech in batch])
+        stamp = db.now()
+        rows = []
+        skipped = []
+        for line, cells, (name, phone, password, specialty) in batch:
+            if phone in existing:
+                skipped.append((line, cells, "رقم الهاتف مستخدم مسبقاً"))
+                continue
+            rows.append((name, phone, password, specialty, 0, stamp))
+
+        if rows:
+            db.insert_many(
+                con, "technicians",
+                ("name", "phone", "password", "specialty", "points", "created_at"),
+                rows
+            )
+            db.bump_counter(con, "technicians_count", len(rows))
+        con.commit()
+    except Exception as e:
+        con.rollback()
+        for line, cells, _ in batch:
+            report.error(line, cells, f"فشل تطبيق الدفعة: {e}")
+        return
+    finally:
+        con.close()
+
+    for err in skipped:
+        report.error(*err)
+    report.batches += 1
+    report.applied += len(rows)
@@ -1,6 +1,16 @@
+import functools
+import hashlib
+import itertools
 import os
+import re
+import secrets
+import select
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import g, has_app_context, has_request_context, session
 
 # إذا موجود DATABASE_URL => نستخدم Postgres (Supabase)
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
@@ -8,9 +18,171 @@ DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 # مسار SQLite (للتشغيل المحلي بدون Supabase)
 DB_PATH = os.path.join(os.path.dirname(__file__), "app.db")
 
+# حجم الـ pool مال Postgres (لكل worker)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# كم ثانية ننتظر اتصال فاضي قبل ما نرمي خطأ
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# اتصال قاعد بالـ pool أكثر من هيچ نسويله SELECT 1 قبل ما نعطيه (NAT/firewall يقطعه بسكوت)
+DB_POOL_PING_SECONDS = float(os.getenv("DB_POOL_PING_SECONDS", "30"))
+# وبعد هالعمر نسكره ونفتح جديد (0 = بدون حد)
+DB_POOL_MAX_AGE = float(os.getenv("DB_POOL_MAX_AGE", "3600"))
+
+# replica للقراءة (اختياري): الـ routes اللي عليها @db.replica_reads تقرا منه
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "").strip()
+# بعد ما الـ session تكتب شي، قراءاتها تروح للـ primary هالكم ثانية (تشوف كتابتها حتى لو الـ replica متأخر)
+DB_READ_STICKY_SECONDS = float(os.getenv("DB_READ_STICKY_SECONDS", "5"))
+# إذا الـ replica ما يرد => primary هالمدة قبل ما نجربه مرة ثانية
+DB_READ_RETRY_SECONDS = float(os.getenv("DB_READ_RETRY_SECONDS", "30"))
+DB_READ_CONNECT_TIMEOUT = int(os.getenv("DB_READ_CONNECT_TIMEOUT", "3"))
+
+# SQLite: production => WAL + pragmas (لكل اتصال) + checkpoint/optimize دوري
+#         legacy     => افتراضيات sqlite (rollback journal, synchronous=FULL) للمقارنة بـ bench/sqlite_writes.py
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production").strip().lower()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024)))
+# كل كم ثانية (لكل process) wal_checkpoint + PRAGMA optimize. 0 => لا
+SQLITE_MAINTENANCE_SECONDS = float(os.getenv("SQLITE_MAINTENANCE_SECONDS", "300"))
+
+# رقم ثابت لـ pg_advisory_lock حتى worker واحد بس يطبق الـ migrations
+_MIGRATION_LOCK_ID = 720260001
+
+
+def now(when=None):
+    return (when or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def timestamp(when=None):
+    """
+    قيمة created_ts بجداول الـ ledger (points_tx / redemptions):
+    TIMESTAMP بالـ postgres، و epoch (int) بالـ sqlite => مقارنة و index بدون strings.
+    """
+    when = when or datetime.now()
+    return when if _is_postgres() else int(when.timestamp())
+
+
+def ledger_now():
+    """(created_at, created_ts) من نفس اللحظة، للـ INSERT على points_tx / redemptions."""
+    when = datetime.now()
+    return now(when), timestamp(when)
+
+
+def day_range(date_from="", date_to=""):
+    """
+    'YYYY-MM-DD' (input type=date) => (since, until) بقيم created_ts، و until حصري (بداية اليوم بعد date_to).
+    الفارغ أو الغلط => None (بدون حد من هالجهة).
+    """
+    def parse(value):
+        try:
+            return datetime.strptime((value or "").strip(), "%Y-%m-%d")
+        except ValueError:
+            return None
+
+    start, end = parse(date_from), parse(date_to)
+    return (
+        timestamp(start) if start else None,
+        timestamp(end + timedelta(days=1)) if end else None,
+    )
+
+
+# ========= Instrumentation (عدد الـ queries + وقتها لكل request) =========
+_query_observers = []
+
+_SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_LIST_RE = re.compile(r"\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)")
+_SQL_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """
+    نفس الـ statement بنفس الشكل مهما تغيرت القيم (label للـ metrics):
+    literals => ?، و IN (?, ?, ...) / VALUES (?,?,?) => (...)
+    """
+    sql = _SQL_STRING_RE.sub("?", sql)
+    sql = _SQL_NUMBER_RE.sub("?", sql)
+    sql = _SQL_LIST_RE.sub("(...)", sql)
+    return _SQL_SPACE_RE.sub(" ", sql).strip()[:300]
+
+
+def add_query_observer(fn):
+    """fn(sql, seconds) بعد كل query (metrics.py يسجل بيها histogram لكل statement)."""
+    _query_observers.append(fn)
+
+
+def _record_query(sql, seconds):
+    if has_app_context():
+        st = g.get("_db_stats")
+        if st is None:
+            st = g._db_stats = {"count": 0, "seconds": 0.0, "slowest_sql": None, "slowest_seconds": 0.0}
+        st["count"] += 1
+        st["seconds"] += seconds
+        if seconds > st["slowest_seconds"]:
+            st["slowest_seconds"] = seconds
+            st["slowest_sql"] = sql
+    for fn in _query_observers:
+        fn(sql, seconds)
+
+
+# (threshold بالثواني, fn(con, sql, params, seconds)) => slow_queries.py
+_slow_query = None
+
 
-def now():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def set_slow_query_handler(threshold_seconds, fn):
+    """أي execute ياخذ >= threshold_seconds تنستدعى fn بعده (على نفس الاتصال). None => يطفيه."""
+    global _slow_query
+    _slow_query = (threshold_seconds, fn) if fn else None
+
+
+def _check_slow(con, sql, params, seconds):
+    slow = _slow_query
+    if slow is not None and seconds >= slow[0]:
+        slow[1](con, sql, params, seconds)
+
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def explain(con, sql, params=()):
+    """
+    خطة الـ query بدون ما تنفذ: EXPLAIN QUERY PLAN (sqlite) / EXPLAIN (FORMAT JSON) (postgres).
+    يرجع {"format": "sqlite"|"postgres", "plan": ...} أو None إذا الـ statement مو query.
+    ما تنحسب بالـ instrumentation (cursor خام).
+    """
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+
+    if isinstance(con, _PgConnWrapper):
+        cur = con.conn.cursor()
+        # savepoint: إذا الـ EXPLAIN فشل ما يخرب الـ transaction مال الـ request
+        cur.execute("SAVEPOINT explain_slow_query")
+        try:
+            cur.execute("EXPLAIN (FORMAT JSON) " + _translate_sql(sql), params or ())
+            plan = cur.fetchone()[0]
+        except Exception:
+            cur.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+            raise
+        finally:
+            cur.execute("RELEASE SAVEPOINT explain_slow_query")
+        return {"format": "postgres", "plan": plan}
+
+    rows = sqlite3.Connection.execute(con, "EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+    # (id, parent, notused, detail) => شجرة نص بمسافات حسب الـ parent
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        d = depth.get(row[1], -1) + 1
+        depth[row[0]] = d
+        lines.append("  " * d + row[3])
+    return {"format": "sqlite", "plan": lines}
+
+
+def request_db_stats():
+    """{"count", "seconds", "slowest_sql", "slowest_seconds"} للـ request الحالي (أو None)."""
+    if not has_app_context():
+        return None
+    return g.get("_db_stats")
 
 
 # ========= Postgres Wrapper (حتى يشتغل كأنه sqlite) =========
@@ -35,39 +207,521 @@ class _PgCursorWrapper:
 
 
 class _PgConnWrapper:
-    def __init__(self, conn):
+    def __init__(self, conn, pool=None, replica=False):
         self.conn = conn
+        self.pool = pool
+        # إذا True => الاتصال مربوط بالـ request، و close() ما ترجعه للـ pool
+        self.request_scoped = False
+        self.replica = replica
+        # كتابة ما انعملها commit بعد (للـ stickiness)
+        self.wrote = False
 
     def execute(self, sql, params=()):
-        cur = self.conn.cursor(cursor_factory=__import__("psycopg2.extras").extras.RealDictCursor)
-        cur.execute(_translate_sql(sql), params or ())
+        import psycopg2.extras
+        if not self.wrote and not sql.lstrip()[:6].upper() == "SELECT":
+            self.wrote = True
+        cur = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        t0 = time.perf_counter()
+        try:
+            cur.execute(_translate_sql(sql), params or ())
+        except psycopg2.OperationalError:
+            if not self.replica:
+                raise
+            # الـ replica وقع بنص الـ request: نفس الـ SELECT على الـ primary
+            self._fail_over()
+            cur = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute(_translate_sql(sql), params or ())
+        finally:
+            elapsed = time.perf_counter() - t0
+            _record_query(sql, elapsed)
+        _check_slow(self, sql, params, elapsed)
+        return _PgCursorWrapper(cur)
+
+    def _fail_over(self):
+        _replica_failed()
+        bad, self.conn = self.conn, None
+        self.pool.putconn(bad)
+        self.pool = _get_pool()
+        self.conn = self.pool.getconn()
+        self.replica = False
+
+    def execute_values(self, sql, rows, page_size=500):
+        # INSERT/UPDATE كثير صفوف بـ round trip واحد لكل page_size (sql فيه VALUES %s)
+        import psycopg2.extras
+        cur = self.conn.cursor()
+        t0 = time.perf_counter()
+        try:
+            psycopg2.extras.execute_values(cur, sql, rows, page_size=page_size)
+        finally:
+            _record_query(sql, time.perf_counter() - t0)
+        self.wrote = True
         return _PgCursorWrapper(cur)
 
     def commit(self):
         self.conn.commit()
+        if self.wrote:
+            self.wrote = False
+            _mark_wrote()
+
+    def rollback(self):
+        self.conn.rollback()
 
     def close(self):
-        self.conn.close()
+        if self.request_scoped:
+            # الاتصال يرجع للـ pool بالـ teardown (وهناك ينعمل rollback لأي شي معلق)
+            return
+        self.release()
 
+    def release(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if self.pool is not None:
+            self.pool.putconn(conn)
+        else:
+            conn.close()
 
-def connect():
-    if _is_postgres():
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _PgPool:
+    """
+    Pool بسيط thread-safe لاتصالات psycopg2.
+    (ThreadedConnectionPool مال psycopg2 يرمي خطأ إذا امتلى بدل ما ينتظر)
+    """
+
+    def __init__(self, dsn, minconn, maxconn, timeout, **connect_kwargs):
+        self.dsn = dsn
+        self.connect_kwargs = connect_kwargs
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, وقت ما رجع للـ pool)
+        self._born = {}  # conn -> وقت الفتح
+        self._size = 0
+        self._filled = False
+        self.created = 0
+        self.checked_out = 0
+        self.waits = 0
+        self.recycled = 0
+
+    def _new_conn(self):
         import psycopg2
         # Supabase يعطي postgresql://...
-        conn = psycopg2.connect(DATABASE_URL)
-        return _PgConnWrapper(conn)
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        with self._cond:
+            self.created += 1
+            self._born[conn] = time.monotonic()
+        return conn
 
-    # SQLite fallback
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
+    def _discard(self, conn):
+        with self._cond:
+            self._born.pop(conn, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _usable(self, conn, idle_since):
+        """
+        نتأكد الاتصال بعده حي قبل ما نعطيه:
+        - السيرفر سكره (restart / idle timeout مال Supabase) => الـ socket يصير readable، بدون round trip
+        - قاعد أكثر من DB_POOL_PING_SECONDS => SELECT 1
+        - أقدم من DB_POOL_MAX_AGE => نبدله
+        """
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if DB_POOL_MAX_AGE and now - self._born.get(conn, now) > DB_POOL_MAX_AGE:
+            return False
+        try:
+            # اتصال idle ما لازم يوصله شي من السيرفر
+            if select.select([conn.fileno()], [], [], 0)[0]:
+                return False
+            if now - idle_since >= DB_POOL_PING_SECONDS:
+                # autocommit حتى الـ SELECT 1 ما يفتح transaction (round trip واحد بس)
+                autocommit, conn.autocommit = conn.autocommit, True
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                finally:
+                    conn.autocommit = autocommit
+        except Exception:
+            return False
+        return True
+
+    def _fill(self):
+        # نفتح minconn اتصالات أول مرة فقط
+        self._filled = True
+        for _ in range(self.minconn):
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._new_conn()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        if not self._filled:
+            self._fill()
+
+        conn = idle_since = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    break
+                self.waits += 1
+                if not self._cond.wait(self.timeout):
+                    raise PoolTimeout(f"no free db connection after {self.timeout}s")
+            self.checked_out += 1
+
+        try:
+            if conn is not None and not self._usable(conn, idle_since):
+                # ميت/قديم: نسكره ونفتح بداله بنفس المكان (الـ _size ما يتغير)
+                self._discard(conn)
+                with self._cond:
+                    self.recycled += 1
+                conn = None
+            if conn is None:
+                conn = self._new_conn()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self.checked_out -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn):
+        import psycopg2.extensions as ext
+
+        keep = not conn.closed
+        if keep:
+            try:
+                if conn.get_transaction_status() != ext.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                keep = False
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+        with self._cond:
+            self.checked_out -= 1
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+                self._born.pop(conn, None)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            for conn, _ in idle:
+                self._born.pop(conn, None)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backend": "postgres",
+                "min": self.minconn,
+                "max": self.maxconn,
+                "open": self._size,
+                "idle": len(self._idle),
+                "checked_out": self.checked_out,
+                "created": self.created,
+                "waits": self.waits,
+                "recycled": self.recycled,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    # بعد fork (gunicorn --preload) ما نشارك sockets الأب
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = _PgPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+    return _pool
+
+
+# ========= SQLite: اتصال واحد لكل thread =========
+class _SqliteConn(sqlite3.Connection):
+    request_scoped = False
+
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            cur = super().execute(sql, params)
+        finally:
+            elapsed = time.perf_counter() - t0
+            _record_query(sql, elapsed)
+        _check_slow(self, sql, params, elapsed)
+        return cur
+
+    def executemany(self, sql, rows):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, rows)
+        finally:
+            _record_query(sql, time.perf_counter() - t0)
+
+    def close(self):
+        # ما نسكر فعلياً، بس نلغي أي شي ما انعمله commit حتى يرجع نظيف
+        if not self.request_scoped:
+            self.rollback()
+            _maybe_sqlite_maintenance(self)
+
+    def release(self):
+        self.rollback()
+        _maybe_sqlite_maintenance(self)
+
+
+_local = threading.local()
+_sqlite_stats = {"created": 0, "journal_mode": None, "maintenance_runs": 0, "last_checkpoint": None}
+_sqlite_stats_lock = threading.Lock()
+_sqlite_maintenance_lock = threading.Lock()
+_sqlite_last_maintenance = time.monotonic()
+
+
+def _sqlite_production_pragmas(con):
+    """
+    لكل اتصال جديد (مرة وحدة لكل thread). بالـ cursor الخام حتى ما تنحسب على الـ request.
+    - WAL: القراء ما يوقفون الكاتب والعكس، والـ commit يكتب بالـ WAL بس (بدون fsync للـ DB)
+    - synchronous=NORMAL: آمن مع WAL (آخر commit ممكن يضيع بانقطاع كهرباء، الـ DB ما يخرب)
+    - busy_timeout: الـ workers ينتظرون الـ lock بدل "database is locked" مباشرة
+    - mmap/cache/temp_store: القراءة من الذاكرة بدل read() syscalls
+    """
+    raw = sqlite3.Connection.execute
+    raw(con, f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    mode = raw(con, "PRAGMA journal_mode=WAL").fetchone()[0]
+    raw(con, "PRAGMA synchronous=NORMAL")
+    # بعد الـ checkpoint ملف الـ -wal يرجع لهالحجم (بدل ما يبقى بأكبر حجم وصله)
+    raw(con, f"PRAGMA journal_size_limit={64 * 1024 * 1024}")
+    raw(con, f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    raw(con, f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    raw(con, "PRAGMA temp_store=MEMORY")
+    with _sqlite_stats_lock:
+        _sqlite_stats["journal_mode"] = mode
+
+
+def _maybe_sqlite_maintenance(con):
+    if SQLITE_PROFILE != "production" or SQLITE_MAINTENANCE_SECONDS <= 0:
+        return
+    if time.monotonic() - _sqlite_last_maintenance < SQLITE_MAINTENANCE_SECONDS:
+        return
+    # thread وحدة بس تسويها، والباقين يكملون بدون انتظار
+    if not _sqlite_maintenance_lock.acquire(blocking=False):
+        return
+    try:
+        if time.monotonic() - _sqlite_last_maintenance >= SQLITE_MAINTENANCE_SECONDS:
+            sqlite_maintenance(con)
+    except sqlite3.Error:
+        pass  # مو مشكلة، نعيد المحاولة بالدورة الجاية
+    finally:
+        _sqlite_maintenance_lock.release()
+
+
+def sqlite_maintenance(con=None):
+    """
+    wal_checkpoint(PASSIVE) (ينقل الـ WAL للـ DB بدون ما يوقف أحد) + PRAGMA optimize
+    (ANALYZE بس للجداول اللي تغيرت). يرجع (busy, wal_pages, checkpointed_pages).
+    """
+    global _sqlite_last_maintenance
+    con = con or _sqlite_connect()
+    raw = sqlite3.Connection.execute
+    result = tuple(raw(con, "PRAGMA wal_checkpoint(PASSIVE)").fetchone())
+    raw(con, "PRAGMA optimize")
+    _sqlite_last_maintenance = time.monotonic()
+    with _sqlite_stats_lock:
+        _sqlite_stats["maintenance_runs"] += 1
+        _sqlite_stats["last_checkpoint"] = result
+    return result
+
+
+def _sqlite_connect():
+    con = getattr(_local, "sqlite", None)
+    if con is None or getattr(_local, "pid", None) != os.getpid():
+        con = sqlite3.connect(DB_PATH, factory=_SqliteConn, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        con.row_factory = sqlite3.Row
+        if SQLITE_PROFILE == "production":
+            _sqlite_production_pragmas(con)
+        _local.sqlite = con
+        _local.pid = os.getpid()
+        with _sqlite_stats_lock:
+            _sqlite_stats["created"] += 1
     return con
 
 
-# ========= Init DB (SQLite أو Postgres) =========
-def init_db():
-    con = connect()
+def _open():
+    if _is_postgres():
+        pool = _get_pool()
+        return _PgConnWrapper(pool.getconn(), pool)
+
+    # SQLite fallback
+    return _sqlite_connect()
+
+
+# ========= Read replica (DATABASE_READ_URL) =========
+_read_pool = None
+_replica_down_until = 0.0
+_replica_stats = {"failovers": 0}
+
+
+def _get_read_pool():
+    global _read_pool
+    if _read_pool is None or _read_pool.pid != os.getpid():
+        with _pool_lock:
+            if _read_pool is None or _read_pool.pid != os.getpid():
+                _read_pool = _PgPool(
+                    DATABASE_READ_URL, 0, DB_POOL_MAX, DB_POOL_TIMEOUT,
+                    connect_timeout=DB_READ_CONNECT_TIMEOUT,
+                )
+    return _read_pool
+
+
+def _replica_failed():
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + DB_READ_RETRY_SECONDS
+    _replica_stats["failovers"] += 1
+
+
+def _replica_available():
+    return bool(DATABASE_READ_URL) and _is_postgres() and time.monotonic() >= _replica_down_until
+
+
+def _mark_wrote():
+    # الـ after_request يحطها بالـ session (الـ cookie يوصل لكل الـ workers)
+    if DATABASE_READ_URL and has_app_context():
+        g._db_wrote = True
+
+
+def _sticky_to_primary():
+    if g.get("_db_wrote"):
+        return True
+    if not has_request_context():
+        return False
+    wrote_at = session.get("_db_wrote_at")
+    return wrote_at is not None and time.time() - wrote_at < DB_READ_STICKY_SECONDS
+
+
+def _open_replica():
+    """اتصال من الـ replica، أو None إذا ما يرد (وننتظر DB_READ_RETRY_SECONDS قبل المحاولة الجاية)."""
+    pool = _get_read_pool()
+    try:
+        return _PgConnWrapper(pool.getconn(), pool, replica=True)
+    except PoolTimeout:
+        return None
+    except Exception:
+        _replica_failed()
+        return None
+
+
+def replica_reads(view):
+    """
+    decorator للـ routes اللي بس تقرا: الـ connect() جوا الـ route يرجع اتصال من الـ replica
+    (إذا DATABASE_READ_URL موجود، والـ session ما كتبت شي قبل شوية، والـ replica شغال).
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g._db_replica_reads = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def connect():
+    """
+    داخل request: نفس الاتصال لكل الـ route (محفوظ على g) ويرجع للـ pool بالـ teardown.
+    برا request (bootstrap / scripts): اتصال من الـ pool، و close() يرجعه.
+    routes عليها @replica_reads => اتصال الـ replica (إذا متوفر).
+    """
+    if has_app_context():
+        if g.get("_db_replica_reads"):
+            con = g.get("_db_read_con")
+            if con is None and _replica_available() and not _sticky_to_primary():
+                con = _open_replica()
+                if con is not None:
+                    con.request_scoped = True
+                    g._db_read_con = con
+            if con is not None:
+                return con
+
+        con = g.get("_db_con")
+        if con is None:
+            con = _open()
+            con.request_scoped = True
+            g._db_con = con
+        return con
+    return _open()
 
+
+def _teardown_db(exc=None):
+    for name in ("_db_con", "_db_read_con"):
+        con = g.pop(name, None)
+        if con is not None:
+            con.release()
+
+
+def _remember_write(resp):
+    if g.get("_db_wrote"):
+        session["_db_wrote_at"] = time.time()
+    return resp
+
+
+def init_app(app):
+    app.teardown_appcontext(_teardown_db)
+    if DATABASE_READ_URL:
+        app.after_request(_remember_write)
+
+
+def pool_stats():
     if _is_postgres():
+        stats = _get_pool().stats()
+        if DATABASE_READ_URL:
+            stats["replica"] = dict(
+                _get_read_pool().stats(),
+                available=_replica_available(),
+                failovers=_replica_stats["failovers"],
+            )
+        return stats
+    with _sqlite_stats_lock:
+        return dict(_sqlite_stats, backend="sqlite", profile=SQLITE_PROFILE)
+
+
+# ========= Migrations (SQLite أو Postgres) =========
+# كل migration ينفذ مرة وحدة فقط، ورقمه ينحفظ بجدول schema_version.
+# أي تعديل جديد على الجداول => نضيف دالة جديدة برقم أكبر بآخر MIGRATIONS.
+
+def _m001_base_tables(con, pg):
+    if pg:
         # جداول Postgres
         con.execute("""
         CREATE TABLE IF NOT EXISTS admins (
@@ -146,9 +800,6 @@ def init_db():
         VALUES(%s,%s)
         ON CONFLICT (key) DO NOTHING
         """, ("iqd_per_point", "10000"))
-
-        con.commit()
-        con.close()
         return
 
     # ===== SQLite (مثل قبل) =====
@@ -212,15 +863,420 @@ def init_db():
     );
     """)
     cur.execute("INSERT OR IGNORE INTO settings(key,value) VALUES(?,?)", ("iqd_per_point", "10000"))
+
+
+def _m002_hot_indexes(con, pg):
+    # نفس الـ SQL يشتغل على SQLite و Postgres
+    for sql in (
+        # user_my_gifts: WHERE tech_id=? ORDER BY id DESC
+        "CREATE INDEX IF NOT EXISTS idx_redemptions_tech_id ON redemptions(tech_id, id DESC)",
+        # admin_winners: WHERE status=? ORDER BY id DESC
+        "CREATE INDEX IF NOT EXISTS idx_redemptions_status_id ON redemptions(status, id DESC)",
+        # user_gifts: WHERE is_active=1 ORDER BY points_required
+        "CREATE INDEX IF NOT EXISTS idx_gifts_active_points ON gifts(is_active, points_required)",
+        # get_winners + dashboard: ORDER BY points DESC
+        "CREATE INDEX IF NOT EXISTS idx_technicians_points ON technicians(points DESC, id DESC)",
+        # سجل النقاط حسب الفني
+        "CREATE INDEX IF NOT EXISTS idx_points_tx_tech_id ON points_tx(tech_id, id)",
+    ):
+        con.execute(sql)
+
+
+def _m003_stats_counters(con, pg):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        name TEXT PRIMARY KEY,
+        value BIGINT NOT NULL DEFAULT 0
+    );
+    """)
+    _rebuild_counters(con)
+
+
+def _m004_leaderboard_rollups(con, pg):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS leaderboard_points (
+        period TEXT NOT NULL,
+        period_key TEXT NOT NULL,
+        tech_id INTEGER NOT NULL,
+        points BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (period, period_key, tech_id)
+    );
+    """)
+    con.execute("""
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_top
+        ON leaderboard_points(period, period_key, points DESC)
+    """)
+
+    # backfill من كل points_tx الموجود (مرة وحدة بس)
+    totals = {}
+    for r in con.execute("SELECT tech_id, points_added, created_at FROM points_tx").fetchall():
+        try:
+            when = datetime.strptime(r["created_at"], "%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            when = None
+        for period, key in _period_keys(when):
+            k = (period, key, r["tech_id"])
+            totals[k] = totals.get(k, 0) + r["points_added"]
+
+    con.execute("DELETE FROM leaderboard_points")
+    for (period, key, tech_id), points in totals.items():
+        con.execute(
+            "INSERT INTO leaderboard_points(period, period_key, tech_id, points) VALUES (?,?,?,?)",
+            (period, key, tech_id, points)
+        )
+
+
+def _m005_technician_search(con, pg):
+    if pg:
+        # LIKE 'prefix%' يستخدم index بس مع text_pattern_ops (إذا الـ collation مو C)
+        con.execute("CREATE INDEX IF NOT EXISTS idx_technicians_phone_prefix ON technicians(phone text_pattern_ops)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_technicians_name_prefix ON technicians(name text_pattern_ops)")
+    else:
+        # phone عليه UNIQUE index أصلاً، نحتاج name فقط
+        con.execute("CREATE INDEX IF NOT EXISTS idx_technicians_name ON technicians(name)")
+
+
+def _m006_gift_image_variants(con, pg):
+    # JSON: {"thumb": {"w": 144, "webp": "...", "fallback": "..."}, "md": {...}}
+    _add_column_if_missing(con, pg, "gifts", "image_variants", "TEXT")
+
+
+def _m007_stored_objects(con, pg):
+    # key = اسم الملف بالـ storage (sha256 + ext)، و refcount = كم هدية تستخدمه
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS stored_objects (
+        key TEXT PRIMARY KEY,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        size BIGINT NOT NULL DEFAULT 0,
+        content_type TEXT,
+        variants TEXT,
+        created_at TEXT NOT NULL
+    );
+    """)
+
+
+def _m008_storage_jobs(con, pg):
+    # طابور حذف ملفات Supabase Storage يشتغل عليه storage.StorageWorker
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS storage_jobs (
+        id {"SERIAL PRIMARY KEY" if pg else "INTEGER PRIMARY KEY AUTOINCREMENT"},
+        op TEXT NOT NULL,
+        object_path TEXT NOT NULL,
+        guard_key TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+        locked_until DOUBLE PRECISION NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TEXT NOT NULL
+    );
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_storage_jobs_due ON storage_jobs(status, next_attempt_at)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_storage_jobs_guard ON storage_jobs(guard_key)")
+
+
+def _m009_data_versions(con, pg):
+    # عداد لكل جدول/فني يزيد مع كل كتابة => ETag للصفحات بدون ما نعيد الـ queries
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    );
+    """)
+
+
+_LEDGER_TS_INDEXES = (
+    # فلتر فني + فترة (تاريخ الفني، تقارير)
+    "CREATE INDEX {} IF NOT EXISTS idx_points_tx_tech_ts ON points_tx(tech_id, created_ts)",
+    "CREATE INDEX {} IF NOT EXISTS idx_redemptions_tech_ts ON redemptions(tech_id, created_ts)",
+    # فترة لكل الفنيين (سجل النقاط / الرابحين بالأدمن)
+    "CREATE INDEX {} IF NOT EXISTS idx_points_tx_ts ON points_tx(created_ts)",
+    "CREATE INDEX {} IF NOT EXISTS idx_redemptions_ts ON redemptions(created_ts)",
+    # الرابحين بالأدمن دائماً بـ status + فترة
+    "CREATE INDEX {} IF NOT EXISTS idx_redemptions_status_ts ON redemptions(status, created_ts)",
+)
+
+
+def _add_column_if_missing(con, pg, table, column, decl):
+    # الـ migration ممكن ينقطع بعد الـ ALTER وقبل ما ينسجل => لازم ينعاد بدون "duplicate column"
+    if pg:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {decl}")
+        return
+    cols = [r["name"] for r in con.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in cols:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _drop_invalid_indexes(con, names):
+    # CREATE INDEX CONCURRENTLY اللي انقطع يخلي index INVALID، و IF NOT EXISTS يتخطاه => نحذفه ونعيده
+    marks = ", ".join("?" for _ in names)
+    rows = con.execute(f"""
+        SELECT c.relname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid AND c.relname IN ({marks})
+    """, list(names)).fetchall()
+    for r in rows:
+        con.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {r['relname']}")
+
+
+def _m010_ledger_timestamps(con, pg):
+    # created_at (TEXT) يبقى للعرض، و created_ts هو اللي نفلتر ونرتب عليه.
+    # كل خطوة تنعاد بأمان: إذا انقطع الـ backfill (deploy timeout / crash) الـ bootstrap الجاي يكمل منه
+    col = "TIMESTAMP" if pg else "INTEGER"
+    _add_column_if_missing(con, pg, "points_tx", "created_ts", col)
+    _add_column_if_missing(con, pg, "redemptions", "created_ts", col)
     con.commit()
+
+    backfill_ledger_timestamps(con)
+
+    if pg:
+        # CONCURRENTLY: الكتابات على الجداول تكمل وقت بناء الـ index (ما يشتغل جوا transaction)
+        con.commit()
+        con.conn.autocommit = True
+        try:
+            _drop_invalid_indexes(con, [re.search(r"EXISTS (\w+)", sql).group(1) for sql in _LEDGER_TS_INDEXES])
+            for sql in _LEDGER_TS_INDEXES:
+                con.execute(sql.format("CONCURRENTLY"))
+        finally:
+            con.conn.autocommit = False
+    else:
+        for sql in _LEDGER_TS_INDEXES:
+            con.execute(sql.format(""))
+
+
+LEDGER_BACKFILL_BATCH = int(os.getenv("LEDGER_BACKFILL_BATCH", "2000"))
+
+
+def backfill_ledger_timestamps(con=None, batch_size=None, pause=0.0):
+    """
+    يعبي created_ts من created_at للصفوف القديمة. دفعات حسب الـ id وكل دفعة commit لوحدها،
+    فكل UPDATE يمسك batch_size صف بس والكتابات العادية تكمل بينهم.
+    ينعاد بأمان (بس الصفوف اللي created_ts مالها NULL). يرجع {table: عدد الدفعات}.
+    """
+    own = con is None
+    con = con or connect()
+    batch_size = batch_size or LEDGER_BACKFILL_BATCH
+    if _is_postgres():
+        # شكل غريب => يبقى NULL بدل ما يفشل الدفعة كلها
+        convert = r"CASE WHEN created_at ~ '^\d{4}-\d{2}-\d{2}' THEN created_at::timestamp END"
+    else:
+        # 'utc': النص وقت محلي (مثل now())، و epoch لازم UTC مثل timestamp()
+        convert = "CAST(strftime('%s', created_at, 'utc') AS INTEGER)"
+
+    batches = {}
+    try:
+        for table in ("points_tx", "redemptions"):
+            top = con.execute(f"SELECT COALESCE(MAX(id), 0) AS m FROM {table}").fetchone()["m"]
+            n = 0
+            for lo in range(0, top, batch_size):
+                con.execute(
+                    f"UPDATE {table} SET created_ts = {convert} "
+                    "WHERE id > ? AND id <= ? AND created_ts IS NULL",
+                    (lo, lo + batch_size)
+                )
+                con.commit()
+                n += 1
+                if pause:
+                    time.sleep(pause)
+            batches[table] = n
+    finally:
+        if own:
+            con.close()
+    return batches
+
+
+def _m011_daily_rollups(con, pg):
+    # تقارير الأدمن تقرا من هذني بس (مو من الـ ledger). day = يوم created_ts بالتوقيت المحلي
+    day = "DATE" if pg else "TEXT"
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS daily_summary (
+        day {day} PRIMARY KEY,
+        tx_count BIGINT NOT NULL DEFAULT 0,
+        purchase_amount BIGINT NOT NULL DEFAULT 0,
+        points_added BIGINT NOT NULL DEFAULT 0,
+        redemptions BIGINT NOT NULL DEFAULT 0,
+        points_spent BIGINT NOT NULL DEFAULT 0
+    );
+    """)
+    # admin_id = 0 إذا الفاتورة بدون أدمن (الـ primary key ما يقبل NULL)
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS daily_points (
+        day {day} NOT NULL,
+        tech_id INTEGER NOT NULL,
+        admin_id INTEGER NOT NULL,
+        tx_count BIGINT NOT NULL,
+        purchase_amount BIGINT NOT NULL,
+        points_added BIGINT NOT NULL,
+        PRIMARY KEY (day, tech_id, admin_id)
+    );
+    """)
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS daily_redemptions (
+        day {day} NOT NULL,
+        tech_id INTEGER NOT NULL,
+        gift_id INTEGER NOT NULL,
+        redemptions BIGINT NOT NULL,
+        points_spent BIGINT NOT NULL,
+        PRIMARY KEY (day, tech_id, gift_id)
+    );
+    """)
+    # high-water mark: آخر id من الـ ledger انحسب بالـ rollups
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        last_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TEXT
+    );
+    """)
+    for name in _ROLLUP_SOURCES:
+        con.execute("INSERT INTO rollup_state(name, last_id) VALUES (?, 0) ON CONFLICT (name) DO NOTHING", (name,))
+    con.commit()
+
+    refresh_rollups(con)
+
+
+def _m012_api_tokens(con, pg):
+    # tokens تطبيق الموبايل: نخزن sha256 بس (الـ token نفسه يطلع مرة وحدة وقت الإصدار)
+    id_col = "SERIAL PRIMARY KEY" if pg else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS api_tokens (
+        id {id_col},
+        tech_id INTEGER NOT NULL,
+        token_hash TEXT UNIQUE NOT NULL,
+        name TEXT,
+        created_at TEXT NOT NULL
+    );
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_api_tokens_tech ON api_tokens(tech_id)")
+
+
+MIGRATIONS = [
+    (1, "base tables", _m001_base_tables),
+    (2, "indexes for hot queries", _m002_hot_indexes),
+    (3, "dashboard counters", _m003_stats_counters),
+    (4, "leaderboard rollups", _m004_leaderboard_rollups),
+    (5, "technician search indexes", _m005_technician_search),
+    (6, "gift image variants", _m006_gift_image_variants),
+    (7, "content-addressed uploads", _m007_stored_objects),
+    (8, "storage job queue", _m008_storage_jobs),
+    (9, "data versions", _m009_data_versions),
+    (10, "ledger timestamps", _m010_ledger_timestamps),
+    (11, "daily report rollups", _m011_daily_rollups),
+    (12, "api tokens", _m012_api_tokens),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _current_schema_version(con):
+    """يرجع None إذا جدول schema_version بعده ما موجود."""
+    try:
+        row = con.execute("SELECT MAX(version) AS v FROM schema_version").fetchone()
+    except Exception:
+        con.rollback()
+        return None
+    return row["v"] or 0
+
+
+def init_db():
+    """
+    يطبق الـ migrations الناقصة فقط.
+    إذا الـ schema حديث => SELECT واحد وبدون أي DDL.
+    """
+    con = connect()
+    try:
+        version = _current_schema_version(con)
+        if version is not None and version >= SCHEMA_VERSION:
+            return
+
+        pg = _is_postgres()
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        );
+        """)
+        con.commit()
+
+        if pg:
+            # أكثر من worker ممكن يبدي بنفس الوقت => واحد بس يطبق
+            con.execute("SELECT pg_advisory_lock(?)", (_MIGRATION_LOCK_ID,))
+        try:
+            version = _current_schema_version(con) or 0
+            for num, name, fn in MIGRATIONS:
+                if num <= version:
+                    continue
+                fn(con, pg)
+                if pg:
+                    con.execute("""
+                        INSERT INTO schema_version(version, name, applied_at) VALUES (?,?,?)
+                        ON CONFLICT (version) DO NOTHING
+                    """, (num, name, now()))
+                else:
+                    con.execute(
+                        "INSERT OR IGNORE INTO schema_version(version, name, applied_at) VALUES (?,?,?)",
+                        (num, name, now())
+                    )
+                con.commit()
+        finally:
+            if pg:
+                con.rollback()
+                con.execute("SELECT pg_advisory_unlock(?)", (_MIGRATION_LOCK_ID,))
+                con.commit()
+    finally:
+        con.close()
+
+
+# ========= Settings cache =========
+# نقرأ كل جدول settings مرة وحدة ونخدم من الذاكرة.
+# كل worker عنده نسخة، فنعيد التحميل كل SETTINGS_CACHE_TTL ثانية حتى تغيير worker ثاني يوصل.
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "10"))
+
+_settings_cache = None
+_settings_loaded_at = 0.0
+_settings_lock = threading.Lock()
+
+
+def _load_settings():
+    con = connect()
+    rows = con.execute("SELECT key, value FROM settings").fetchall()
     con.close()
+    return {r["key"]: r["value"] for r in rows}
+
+
+def _settings():
+    global _settings_cache, _settings_loaded_at
+    cache = _settings_cache
+    if cache is not None and time.monotonic() - _settings_loaded_at < SETTINGS_CACHE_TTL:
+        return cache
+
+    with _settings_lock:
+        if _settings_cache is None or time.monotonic() - _settings_loaded_at >= SETTINGS_CACHE_TTL:
+            _settings_cache = _load_settings()
+            _settings_loaded_at = time.monotonic()
+        return _settings_cache
+
+
+def invalidate_settings():
+    global _settings_cache
+    with _settings_lock:
+        _settings_cache = None
 
 
 def get_setting(key, default=None):
+    return _settings().get(key, default)
+
+
+def set_setting(key, value):
     con = connect()
-    row = con.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
+    con.execute("""
+        INSERT INTO settings(key, value) VALUES (?,?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    """, (key, str(value)))
+    con.commit()
     con.close()
-    return (row["value"] if row else default)
+    invalidate_settings()
 
 
 # ملاحظة: إذا بعدك تستخدم هذني بدوال winners خليهن لاحقاً نكملهن
@@ -233,26 +1289,566 @@ def get_gift_by_id(gift_id: int):
     return row
 
 
-def delete_gift(gift_id: int):
+def delete_gift(gift_id: int, release_image=None):
+    """
+    يحذف الهدية، و release_image(con, image_filename, image_variants) بنفس الـ transaction
+    بس إذا الصف انحذف فعلاً. إذا فشل التحرير ينلغي الحذف كله (ما تبقى هدية على صورة محررة).
+    يرجع True إذا انحذفت.
+    """
+    con = connect()
+    try:
+        row = con.execute(
+            "DELETE FROM gifts WHERE id=? RETURNING is_active, image_filename, image_variants", (gift_id,)
+        ).fetchone()
+        if row:
+            if row["is_active"] == 1:
+                bump_counter(con, "gifts_active", -1)
+            bump_versions(con, ["gifts"])
+            if release_image and row["image_filename"]:
+                release_image(con, str(row["image_filename"]), row["image_variants"])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+    return row is not None
+
+
+# ========= Stored objects (uploads حسب الـ hash + refcount) =========
+def acquire_object(key):
+    """
+    إذا الملف مسجل (يعني مرفوع): يزيد الـ refcount ويرجع الصف {"variants": ...}.
+    None => مو موجود، لازم ينرفع وبعدها register_object.
+    """
+    con = connect()
+    try:
+        rows = con.execute("""
+            UPDATE stored_objects SET refcount = refcount + 1
+            WHERE key=?
+            RETURNING variants
+        """, (key,)).fetchall()
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+    return rows[0] if rows else None
+
+
+def register_object(key, content_type=None, size=0, variants=None):
+    """
+    بعد ما الملف ونسخه انرفعوا فعلاً: يسجله بـ refcount 1، أو يزيده إذا رفع ثاني سبقنا.
+    يرجع الـ variants المسجلة (اللي سبق يبقى، وإذا ما عنده نكمل بمالتنا).
+    """
+    con = connect()
+    try:
+        row = con.execute("""
+            INSERT INTO stored_objects(key, refcount, size, content_type, variants, created_at)
+            VALUES (?, 1, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                refcount = stored_objects.refcount + 1,
+                variants = COALESCE(stored_objects.variants, excluded.variants)
+            RETURNING variants
+        """, (key, size, content_type, variants, now())).fetchall()[0]
+        # انرفع من جديد => أي حذف بالطابور لنفس الملف ما عاد إله داعي
+        con.execute("DELETE FROM storage_jobs WHERE op='delete' AND guard_key=?", (key,))
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+    return row["variants"]
+
+
+def set_object_variants(key, variants):
+    con = connect()
+    con.execute("UPDATE stored_objects SET variants=? WHERE key=?", (variants, key))
+    con.commit()
+    con.close()
+
+
+def object_refcount(key):
+    con = connect()
+    row = con.execute("SELECT refcount FROM stored_objects WHERE key=?", (key,)).fetchone()
+    con.close()
+    return row["refcount"] if row else None
+
+
+def release_object(key, delete_files, con=None):
+    """
+    ينقص الـ refcount. إذا وصل صفر: يحذف الصف و يستدعي delete_files(con, key, variants)
+    قبل الـ commit (الصف مقفول، فرفع جديد لنفس الـ hash ينتظر وما ينحذف ملفه).
+    يرجع None إذا الـ key مو مسجل (صور قديمة قبل الـ hash)، غير ذلك True إذا انحذف الملف.
+    مع con: بدون commit (جزء من transaction أكبر، مثل delete_gift).
+    """
+    own = con is None
+    con = con or connect()
+    try:
+        rows = con.execute("""
+            UPDATE stored_objects SET refcount = refcount - 1
+            WHERE key=?
+            RETURNING refcount, variants
+        """, (key,)).fetchall()
+        if not rows:
+            if own:
+                con.rollback()
+            return None
+
+        deleted = False
+        if rows[0]["refcount"] <= 0:
+            con.execute("DELETE FROM stored_objects WHERE key=?", (key,))
+            delete_files(con, key, rows[0]["variants"])
+            deleted = True
+        if own:
+            con.commit()
+        return deleted
+    except Exception:
+        if own:
+            con.rollback()
+        raise
+    finally:
+        if own:
+            con.close()
+
+
+# ========= Storage jobs (طابور الخلفية) =========
+def enqueue_storage_job(con, op, object_path, guard_key=None):
+    # بدون commit: ينحفظ مع نفس الـ transaction اللي طلبته
+    con.execute("""
+        INSERT INTO storage_jobs(op, object_path, guard_key, status,
+                                 attempts, next_attempt_at, locked_until, created_at)
+        VALUES (?,?,?,'pending',0,0,0,?)
+    """, (op, object_path, guard_key, now()))
+
+
+def claim_storage_job(lease_seconds=120):
+    """
+    ياخذ أقدم job جاهز ويحجزه lease_seconds (إذا الـ worker مات، يرجع جاهز بعدها).
+    شرط locked_until بالـ WHERE الخارجي حتى اثنين workers ما ياخذون نفس الـ job.
+    """
+    t = time.time()
+    con = connect()
+    try:
+        rows = con.execute("""
+            UPDATE storage_jobs SET locked_until = ?, attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM storage_jobs
+                WHERE status='pending' AND next_attempt_at <= ? AND locked_until <= ?
+                ORDER BY id LIMIT 1
+            )
+            AND locked_until <= ?
+            RETURNING id, op, object_path, guard_key, attempts
+        """, (t + lease_seconds, t, t, t)).fetchall()
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+    return dict(rows[0]) if rows else None
+
+
+def finish_storage_job(job_id):
+    con = connect()
+    con.execute("DELETE FROM storage_jobs WHERE id=?", (job_id,))
+    con.commit()
+    con.close()
+
+
+def fail_storage_job(job_id, error, retry_in, dead=False):
     con = connect()
-    con.execute("DELETE FROM gifts WHERE id=?", (gift_id,))
+    con.execute("""
+        UPDATE storage_jobs
+        SET status=?, next_attempt_at=?, locked_until=0, last_error=?
+        WHERE id=?
+    """, ("dead" if dead else "pending", time.time() + retry_in, error, job_id))
     con.commit()
     con.close()
 
 
+def storage_job_stats():
+    con = connect()
+    rows = con.execute("SELECT status, COUNT(*) AS n FROM storage_jobs GROUP BY status").fetchall()
+    con.close()
+    stats = {"pending": 0, "dead": 0}
+    stats.update({r["status"]: r["n"] for r in rows})
+    return stats
+
+
+# ========= Technicians list / search =========
+def list_technicians(before_id=None, limit: int = 50):
+    """
+    Keyset pagination (الأحدث أولاً): الصفحة الجاية تبدي من id أصغر من آخر id.
+    يرجع (rows, next_before_id) و next_before_id = None إذا ماكو صفحة بعدها.
+    """
+    con = connect()
+    if before_id:
+        rows = con.execute(
+            "SELECT * FROM technicians WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before_id, limit + 1)
+        ).fetchall()
+    else:
+        rows = con.execute("SELECT * FROM technicians ORDER BY id DESC LIMIT ?", (limit + 1,)).fetchall()
+    con.close()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]["id"]
+    return rows, None
+
+
+# ========= Ledger (سجل النقاط) =========
+def list_points_tx(tech_id=None, since=None, until=None, limit: int = 200):
+    """
+    آخر حركات النقاط (مع اسم الفني) + المجموع لنفس الفلتر.
+    since/until من day_range => range على created_ts (idx_points_tx_ts / idx_points_tx_tech_ts).
+    يرجع (rows, totals).
+    """
+    where, params = [], []
+    if tech_id:
+        where.append("p.tech_id = ?")
+        params.append(tech_id)
+    if since is not None:
+        where.append("p.created_ts >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("p.created_ts < ?")
+        params.append(until)
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    # بدون فترة نرتب بالـ id (يشمل صفوف ما وصلها الـ backfill بعد)
+    order = "p.created_ts DESC, p.id DESC" if since is not None or until is not None else "p.id DESC"
+
+    con = connect()
+    rows = con.execute(f"""
+        SELECT p.id, p.tech_id, t.name AS tech_name, p.purchase_amount, p.points_added, p.created_at, p.admin_id
+        FROM points_tx p
+        LEFT JOIN technicians t ON t.id = p.tech_id
+        {where_sql}
+        ORDER BY {order}
+        LIMIT ?
+    """, (*params, limit)).fetchall()
+    totals = con.execute(f"""
+        SELECT COUNT(*) AS tx_count,
+               COALESCE(SUM(p.points_added), 0) AS points,
+               COALESCE(SUM(p.purchase_amount), 0) AS amount
+        FROM points_tx p
+        {where_sql}
+    """, params).fetchone()
+    con.close()
+    return rows, totals
+
+
+# ========= Streaming (exports) =========
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+_export_seq = itertools.count(1)
+
+
+def stream_query(sql, params=(), batch_size=None):
+    """
+    generator يرجع الصفوف وحدة وحدة بدون ما يحملهم كلهم بالذاكرة (exports بحجم الـ ledger كله).
+    postgres => named (server-side) cursor و fetchmany(batch_size)، من الـ replica إذا متوفر.
+    sqlite   => اتصال خاص ونمشي على الـ cursor.
+    الاتصال مو مال الـ request: يرجع للـ pool لما يخلص أو إذا التحميل انقطع (GeneratorExit).
+    """
+    batch_size = batch_size or EXPORT_FETCH_SIZE
+    if _is_postgres():
+        import psycopg2.extras
+        con = _open_replica() if _replica_available() else None
+        if con is None:
+            pool = _get_pool()
+            con = _PgConnWrapper(pool.getconn(), pool)
+        try:
+            cur = con.conn.cursor(
+                name=f"export_{os.getpid()}_{next(_export_seq)}",
+                cursor_factory=psycopg2.extras.RealDictCursor,
+            )
+            cur.itersize = batch_size
+            t0 = time.perf_counter()
+            cur.execute(_translate_sql(sql), params or ())
+            _record_query(sql, time.perf_counter() - t0)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+            cur.close()
+        finally:
+            con.release()
+        return
+
+    con = sqlite3.connect(DB_PATH, factory=_SqliteConn, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    con.row_factory = sqlite3.Row
+    try:
+        if SQLITE_PROFILE == "production":
+            _sqlite_production_pragmas(con)
+        cur = con.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        sqlite3.Connection.close(con)
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_technicians(q, limit: int = 20):
+    """بحث بأول رقم الهاتف أو أول الاسم (للـ typeahead)."""
+    q = (q or "").strip()
+    if not q:
+        return []
+
+    con = connect()
+    if _is_postgres():
+        like = _escape_like(q) + "%"
+        rows = con.execute("""
+            SELECT id, name, phone, points
+            FROM technicians
+            WHERE phone LIKE ? OR name LIKE ?
+            ORDER BY name
+            LIMIT ?
+        """, (like, like, limit)).fetchall()
+    else:
+        # LIKE بـ SQLite ما يستخدم الـ index (case-insensitive)، فنستخدم range على الـ prefix
+        upper = q[:-1] + chr(ord(q[-1]) + 1)
+        rows = con.execute("""
+            SELECT id, name, phone, points
+            FROM technicians
+            WHERE (phone >= ? AND phone < ?) OR (name >= ? AND name < ?)
+            ORDER BY name
+            LIMIT ?
+        """, (q, upper, q, upper, limit)).fetchall()
+    con.close()
+    return [dict(r) for r in rows]
+
+
+# ========= Batch writes (للاستيراد بالجملة) =========
+# SQLite: executemany | Postgres: execute_values (صفوف كثيرة بكل round trip)
+def insert_many(con, table, columns, rows):
+    if not rows:
+        return
+    cols = ", ".join(columns)
+    if _is_postgres():
+        con.execute_values(f"INSERT INTO {table}({cols}) VALUES %s", rows)
+    else:
+        marks = ", ".join("?" for _ in columns)
+        con.executemany(f"INSERT INTO {table}({cols}) VALUES ({marks})", rows)
+
+
+def add_points_many(con, tech_points):
+    """tech_points: [(tech_id, points), ...] وكل tech_id مرة وحدة."""
+    if not tech_points:
+        return
+    if _is_postgres():
+        con.execute_values("""
+            UPDATE technicians AS t SET points = t.points + v.points
+            FROM (VALUES %s) AS v(id, points)
+            WHERE t.id = v.id
+        """, tech_points)
+    else:
+        con.executemany(
+            "UPDATE technicians SET points = points + ? WHERE id=?",
+            [(points, tech_id) for tech_id, points in tech_points]
+        )
+
+
+def technician_ids_by_phone(con, phones):
+    phones = list(set(phones))
+    if not phones:
+        return {}
+    marks = ", ".join("?" for _ in phones)
+    rows = con.execute(f"SELECT id, phone FROM technicians WHERE phone IN ({marks})", phones).fetchall()
+    return {r["phone"]: r["id"] for r in rows}
+
+
+# ========= Dashboard counters =========
+# لوحة التحكم تقرأ من stats_counters بدل COUNT/SUM على كل الجداول.
+# أي route يغير هذني الأرقام لازم يستدعي bump_counter بنفس الـ transaction.
+COUNTER_QUERIES = {
+    "technicians_count": "SELECT COUNT(*) AS v FROM technicians",
+    "gifts_active": "SELECT COUNT(*) AS v FROM gifts WHERE is_active=1",
+    "points_total": "SELECT COALESCE(SUM(points_added),0) AS v FROM points_tx",
+    "redemptions_count": "SELECT COUNT(*) AS v FROM redemptions",
+    "points_spent": "SELECT COALESCE(SUM(points_spent),0) AS v FROM redemptions",
+}
+
+
+def bump_counter(con, name, delta=1):
+    # بدون commit: الـ commit مال الـ route نفسه
+    con.execute("UPDATE stats_counters SET value = value + ? WHERE name=?", (delta, name))
+
+
+def bump_counters(con, deltas):
+    """عدة counters ({name: delta}) بـ UPDATE واحد: round trip واحد بدل واحد لكل counter."""
+    names = sorted(deltas)
+    if len(names) == 1:
+        return bump_counter(con, names[0], deltas[names[0]])
+    cases = " ".join("WHEN ? THEN ?" for _ in names)
+    marks = ", ".join("?" for _ in names)
+    params = [x for name in names for x in (name, deltas[name])] + names
+    con.execute(f"""
+        UPDATE stats_counters SET value = value + CASE name {cases} END
+        WHERE name IN ({marks})
+    """, params)
+
+
+# ========= Data versions (ETag للصفحات) =========
+# scope = اسم جدول ("gifts") أو فني (tech_scope(id)). كل كتابة تزيد الرقم بنفس الـ transaction.
+def tech_scope(tech_id):
+    return f"tech:{tech_id}"
+
+
+def bump_versions(con, scopes):
+    # بدون commit. مرتبة حتى transactions بنفس الوقت تقفل الصفوف بنفس الترتيب
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+    if len(scopes) == 1:
+        con.execute("""
+            INSERT INTO data_versions(scope, version) VALUES (?, 1)
+            ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1
+        """, (scopes[0],))
+    elif _is_postgres():
+        con.execute_values("""
+            INSERT INTO data_versions(scope, version) VALUES %s
+            ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1
+        """, [(scope, 1) for scope in scopes])
+    else:
+        con.executemany("""
+            INSERT INTO data_versions(scope, version) VALUES (?, 1)
+            ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1
+        """, [(scope,) for scope in scopes])
+
+
+def get_versions(scopes):
+    """query وحدة: {scope: version} و 0 إذا ما صار عليه كتابة بعد."""
+    scopes = list(scopes)
+    marks = ", ".join("?" for _ in scopes)
+    con = connect()
+    rows = con.execute(f"SELECT scope, version FROM data_versions WHERE scope IN ({marks})", scopes).fetchall()
+    con.close()
+    versions = {scope: 0 for scope in scopes}
+    versions.update({r["scope"]: r["version"] for r in rows})
+    return versions
+
+
+def get_counters():
+    con = connect()
+    rows = con.execute("SELECT name, value FROM stats_counters").fetchall()
+    con.close()
+    counters = {name: 0 for name in COUNTER_QUERIES}
+    counters.update({r["name"]: r["value"] for r in rows})
+    return counters
+
+
+def _rebuild_counters(con):
+    for name, sql in COUNTER_QUERIES.items():
+        value = con.execute(sql).fetchone()["v"]
+        con.execute("""
+            INSERT INTO stats_counters(name, value) VALUES (?,?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        """, (name, value))
+
+
+def rebuild_counters():
+    """
+    يعيد حساب كل العدادات من الصفر (بعد تعديل يدوي على الـ DB مثلاً).
+    نقفل stats_counters أول شي حتى أي bump_counter بنفس الوقت ينتظر وما يضيع.
+    """
+    con = connect()
+    try:
+        if _is_postgres():
+            con.execute("LOCK TABLE stats_counters IN EXCLUSIVE MODE")
+        else:
+            con.execute("BEGIN IMMEDIATE")
+        _rebuild_counters(con)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+    return get_counters()
+
+
+# ========= Redemption (استبدال هدية) =========
+REDEEM_OK = "ok"
+REDEEM_INSUFFICIENT = "insufficient"
+REDEEM_NOT_FOUND = "not_found"
+
+
+def redeem_gift(tech_id: int, gift_id: int):
+    """
+    يخصم النقاط ويسجل الطلب بنفس الـ transaction.
+    فحص الرصيد داخل الـ UPDATE نفسه (WHERE points >= ...)
+    فلو ضغط الفني مرتين بنفس الوقت ما ينخصم أكثر من رصيده.
+    يرجع (status, new_points)
+    """
+    con = connect()
+    try:
+        rows = con.execute("""
+            UPDATE technicians
+            SET points = points - (SELECT points_required FROM gifts WHERE id=? AND is_active=1)
+            WHERE id=?
+              AND points >= (SELECT points_required FROM gifts WHERE id=? AND is_active=1)
+            RETURNING points
+        """, (gift_id, tech_id, gift_id)).fetchall()
+
+        if not rows:
+            con.rollback()
+            return _redeem_failure_reason(con, tech_id, gift_id), None
+
+        spent = con.execute("""
+            INSERT INTO redemptions(tech_id, gift_id, points_spent, created_at, created_ts, status)
+            SELECT ?, id, points_required, ?, ?, 'pending' FROM gifts WHERE id=?
+            RETURNING points_spent
+        """, (tech_id, *ledger_now(), gift_id)).fetchall()[0]["points_spent"]
+        bump_counters(con, {"redemptions_count": 1, "points_spent": spent})
+        bump_versions(con, [tech_scope(tech_id)])
+        con.commit()
+        return REDEEM_OK, rows[0]["points"]
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+def _redeem_failure_reason(con, tech_id, gift_id):
+    # مسار الفشل فقط: نعرف السبب حتى نعرض الرسالة الصحيحة
+    row = con.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM technicians WHERE id=?) AS tech_found,
+            (SELECT COUNT(*) FROM gifts WHERE id=? AND is_active=1) AS gift_found
+    """, (tech_id, gift_id)).fetchone()
+    if row["tech_found"] and row["gift_found"]:
+        return REDEEM_INSUFFICIENT
+    return REDEEM_NOT_FOUND
+
+
 def get_winners(limit: int = 20):
     """
     إذا جدول winners موجود نقرأ منه،
     وإذا ما موجود (أو فارغ) نجيب أعلى الفنيين نقاط.
     """
+    return _cached_leaderboard(("winners", limit), lambda: _load_winners(limit))
+
+
+def _load_winners(limit):
     con = connect()
     try:
         rows = con.execute("SELECT * FROM winners ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
         if rows:
             con.close()
-            return rows
+            return [dict(r) for r in rows]
     except Exception:
-        pass
+        con.rollback()
 
     # fallback: أعلى نقاط من الفنيين
     rows = con.execute("""
@@ -262,4 +1858,344 @@ def get_winners(limit: int = 20):
         LIMIT ?
     """, (limit,)).fetchall()
     con.close()
+    return [dict(r) for r in rows]
+
+
+# ========= Leaderboards (أسبوعي / شهري / كل الوقت) =========
+# leaderboard_points يتحدث مع كل إضافة نقاط (add_leaderboard_points)،
+# والـ top-N ينخزن بالذاكرة لحد ما تصير كتابة أو يخلص الـ TTL.
+LEADERBOARD_PERIODS = ("week", "month", "all")
+LEADERBOARD_CACHE_TTL = float(os.getenv("LEADERBOARD_CACHE_TTL", "30"))
+
+_leaderboard_cache = {}
+_leaderboard_lock = threading.Lock()
+
+
+def _period_keys(when=None):
+    """يرجع [(period, period_key), ...] للتاريخ. بدون تاريخ => all فقط."""
+    if when is None:
+        return [("all", "all")]
+    year, week, _ = when.isocalendar()
+    return [
+        ("week", f"{year}-W{week:02d}"),
+        ("month", when.strftime("%Y-%m")),
+        ("all", "all"),
+    ]
+
+
+def add_leaderboard_points(con, tech_id, points, when=None):
+    # بدون commit: نفس transaction مال points_tx. كل الفترات بـ statement واحد
+    add_leaderboard_points_many(con, [(tech_id, points)], when)
+
+
+def add_leaderboard_points_many(con, tech_points, when=None):
+    """نفس add_leaderboard_points بس لمجموعة فنيين (كل tech_id مرة وحدة)."""
+    rows = [
+        (period, key, tech_id, points)
+        for period, key in _period_keys(when or datetime.now())
+        for tech_id, points in tech_points
+    ]
+    if not rows:
+        return
+    if _is_postgres():
+        con.execute_values("""
+            INSERT INTO leaderboard_points(period, period_key, tech_id, points) VALUES %s
+            ON CONFLICT (period, period_key, tech_id)
+            DO UPDATE SET points = leaderboard_points.points + excluded.points
+        """, rows)
+    else:
+        con.executemany("""
+            INSERT INTO leaderboard_points(period, period_key, tech_id, points) VALUES (?,?,?,?)
+            ON CONFLICT (period, period_key, tech_id)
+            DO UPDATE SET points = leaderboard_points.points + excluded.points
+        """, rows)
+
+
+def invalidate_leaderboards():
+    # نستدعيها بعد الـ commit
+    with _leaderboard_lock:
+        _leaderboard_cache.clear()
+
+
+def _cached_leaderboard(cache_key, load):
+    hit = _leaderboard_cache.get(cache_key)
+    if hit is not None and time.monotonic() < hit[0]:
+        return hit[1]
+    rows = load()
+    with _leaderboard_lock:
+        _leaderboard_cache[cache_key] = (time.monotonic() + LEADERBOARD_CACHE_TTL, rows)
     return rows
+
+
+def get_leaderboard(period="all", limit: int = 20):
+    if period not in LEADERBOARD_PERIODS:
+        period = "all"
+    key = dict(_period_keys(datetime.now()))[period]
+    return _cached_leaderboard((period, key, limit), lambda: _load_leaderboard(period, key, limit))
+
+
+def _load_leaderboard(period, key, limit):
+    con = connect()
+    rows = con.execute("""
+        SELECT t.id, t.name, l.points
+        FROM leaderboard_points l
+        JOIN technicians t ON t.id = l.tech_id
+        WHERE l.period=? AND l.period_key=?
+        ORDER BY l.points DESC, t.id DESC
+        LIMIT ?
+    """, (period, key, limit)).fetchall()
+    con.close()
+    return [dict(r) for r in rows]
+
+
+# ========= Daily rollups (تقارير الأدمن) =========
+# كل ledger (points_tx / redemptions) ينضاف للـ rollups من آخر id انحسب (rollup_state) وطالع،
+# فكل refresh يقرا بس الصفوف الجديدة. صفحة التقارير تقرا الـ rollups بس:
+# سنة كاملة = ~365 صف من daily_summary بدل كل الـ ledger.
+ROLLUP_BATCH = int(os.getenv("ROLLUP_BATCH", "5000"))
+# الـ ids بالـ postgres تنحجز قبل الـ commit: transaction بطيئة ممكن تـ commit id أصغر من اللي شفناه،
+# فما نعبر صفوف أحدث من هالكم ثانية. الـ sqlite يكتب واحد واحد => الـ ids تـ commit بالترتيب، ما نحتاجها
+ROLLUP_SAFETY_SECONDS = float(os.getenv("ROLLUP_SAFETY_SECONDS", "60"))
+
+
+def _rollup_day(alias):
+    if _is_postgres():
+        return f"COALESCE({alias}.created_ts::date, CAST(substr({alias}.created_at, 1, 10) AS DATE))"
+    return f"COALESCE(date({alias}.created_ts, 'unixepoch', 'localtime'), substr({alias}.created_at, 1, 10))"
+
+
+def _rollup_points(con, lo, hi):
+    day = _rollup_day("p")
+    con.execute(f"""
+        INSERT INTO daily_points(day, tech_id, admin_id, tx_count, purchase_amount, points_added)
+        SELECT {day}, p.tech_id, COALESCE(p.admin_id, 0), COUNT(*), SUM(p.purchase_amount), SUM(p.points_added)
+        FROM points_tx p
+        WHERE p.id > ? AND p.id <= ?
+        GROUP BY {day}, p.tech_id, COALESCE(p.admin_id, 0)
+        ON CONFLICT (day, tech_id, admin_id) DO UPDATE SET
+            tx_count = daily_points.tx_count + excluded.tx_count,
+            purchase_amount = daily_points.purchase_amount + excluded.purchase_amount,
+            points_added = daily_points.points_added + excluded.points_added
+    """, (lo, hi))
+    con.execute(f"""
+        INSERT INTO daily_summary(day, tx_count, purchase_amount, points_added)
+        SELECT {day}, COUNT(*), SUM(p.purchase_amount), SUM(p.points_added)
+        FROM points_tx p
+        WHERE p.id > ? AND p.id <= ?
+        GROUP BY {day}
+        ON CONFLICT (day) DO UPDATE SET
+            tx_count = daily_summary.tx_count + excluded.tx_count,
+            purchase_amount = daily_summary.purchase_amount + excluded.purchase_amount,
+            points_added = daily_summary.points_added + excluded.points_added
+    """, (lo, hi))
+
+
+def _rollup_redemptions(con, lo, hi):
+    day = _rollup_day("r")
+    con.execute(f"""
+        INSERT INTO daily_redemptions(day, tech_id, gift_id, redemptions, points_spent)
+        SELECT {day}, r.tech_id, r.gift_id, COUNT(*), SUM(r.points_spent)
+        FROM redemptions r
+        WHERE r.id > ? AND r.id <= ?
+        GROUP BY {day}, r.tech_id, r.gift_id
+        ON CONFLICT (day, tech_id, gift_id) DO UPDATE SET
+            redemptions = daily_redemptions.redemptions + excluded.redemptions,
+            points_spent = daily_redemptions.points_spent + excluded.points_spent
+    """, (lo, hi))
+    con.execute(f"""
+        INSERT INTO daily_summary(day, redemptions, points_spent)
+        SELECT {day}, COUNT(*), SUM(r.points_spent)
+        FROM redemptions r
+        WHERE r.id > ? AND r.id <= ?
+        GROUP BY {day}
+        ON CONFLICT (day) DO UPDATE SET
+            redemptions = daily_summary.redemptions + excluded.redemptions,
+            points_spent = daily_summary.points_spent + excluded.points_spent
+    """, (lo, hi))
+
+
+# state name => (الجدول، الدالة اللي تجمع دفعة)
+_ROLLUP_SOURCES = {
+    "points_tx": ("points_tx", _rollup_points),
+    "redemptions": ("redemptions", _rollup_redemptions),
+}
+
+
+def refresh_rollups(con=None, batch_size=None, safety_seconds=None):
+    """
+    يضيف صفوف الـ ledger الجديدة (id > last_id) للـ rollups، دفعة دفعة وكل دفعة commit.
+    الـ state row ينقفل (FOR UPDATE / BEGIN IMMEDIATE) فاثنين بنفس الوقت ما يحسبون نفس الصفوف مرتين.
+    يرجع {name: كم صف انضاف}.
+    """
+    own = con is None
+    con = con or connect()
+    pg = _is_postgres()
+    batch_size = batch_size or ROLLUP_BATCH
+    if safety_seconds is None:
+        safety_seconds = ROLLUP_SAFETY_SECONDS if pg else 0
+    cutoff = timestamp(datetime.now() - timedelta(seconds=safety_seconds)) if safety_seconds > 0 else None
+
+    added = {}
+    try:
+        for name, (table, apply) in _ROLLUP_SOURCES.items():
+            added[name] = 0
+            while True:
+                if not pg:
+                    con.execute("BEGIN IMMEDIATE")
+                last_id = con.execute(
+                    "SELECT last_id FROM rollup_state WHERE name=?" + (" FOR UPDATE" if pg else ""), (name,)
+                ).fetchone()["last_id"]
+                if cutoff is None:
+                    top = con.execute(f"SELECT COALESCE(MAX(id), 0) AS m FROM {table}").fetchone()["m"]
+                else:
+                    # created_ts IS NULL = صفوف قديمة ما وصلها الـ backfill => أكيد خلصت
+                    top = con.execute(f"""
+                        SELECT COALESCE(MAX(id), 0) AS m FROM {table}
+                        WHERE id > ? AND (created_ts < ? OR created_ts IS NULL)
+                    """, (last_id, cutoff)).fetchone()["m"]
+                hi = min(top, last_id + batch_size)
+                if hi <= last_id:
+                    con.rollback()
+                    break
+                apply(con, last_id, hi)
+                con.execute(
+                    "UPDATE rollup_state SET last_id=?, updated_at=? WHERE name=?", (hi, now(), name)
+                )
+                con.commit()
+                added[name] += hi - last_id
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        if own:
+            con.close()
+    return added
+
+
+def rollup_status():
+    """{name: {last_id, updated_at, behind}}، behind = كم id بالـ ledger بعد ما دخل (MAX(id) على الـ PK، رخيص)."""
+    con = connect()
+    rows = con.execute("SELECT name, last_id, updated_at FROM rollup_state").fetchall()
+    status = {}
+    for r in rows:
+        s = dict(r)
+        table = _ROLLUP_SOURCES[r["name"]][0]
+        top = con.execute(f"SELECT COALESCE(MAX(id), 0) AS m FROM {table}").fetchone()["m"]
+        s["behind"] = max(0, top - r["last_id"])
+        status[r["name"]] = s
+    con.close()
+    return status
+
+
+def _day_str(value):
+    # postgres يرجع date، sqlite يرجع TEXT
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def report(date_from, date_to, top: int = 10):
+    """
+    كل أرقام صفحة التقارير لفترة (YYYY-MM-DD، شاملة) من الـ rollups بس.
+    """
+    con = connect()
+    params = (date_from, date_to)
+    days = con.execute("""
+        SELECT day, tx_count, purchase_amount, points_added, redemptions, points_spent
+        FROM daily_summary
+        WHERE day >= ? AND day <= ?
+        ORDER BY day
+    """, params).fetchall()
+    top_techs = con.execute("""
+        SELECT d.tech_id, t.name AS tech_name,
+               SUM(d.tx_count) AS tx_count, SUM(d.purchase_amount) AS purchase_amount,
+               SUM(d.points_added) AS points_added
+        FROM daily_points d
+        LEFT JOIN technicians t ON t.id = d.tech_id
+        WHERE d.day >= ? AND d.day <= ?
+        GROUP BY d.tech_id, t.name
+        ORDER BY SUM(d.points_added) DESC
+        LIMIT ?
+    """, (*params, top)).fetchall()
+    by_admin = con.execute("""
+        SELECT d.admin_id, a.email AS admin_email,
+               SUM(d.tx_count) AS tx_count, SUM(d.purchase_amount) AS purchase_amount,
+               SUM(d.points_added) AS points_added
+        FROM daily_points d
+        LEFT JOIN admins a ON a.id = d.admin_id
+        WHERE d.day >= ? AND d.day <= ?
+        GROUP BY d.admin_id, a.email
+        ORDER BY SUM(d.purchase_amount) DESC
+    """, params).fetchall()
+    top_gifts = con.execute("""
+        SELECT d.gift_id, g.name AS gift_name,
+               SUM(d.redemptions) AS redemptions, SUM(d.points_spent) AS points_spent
+        FROM daily_redemptions d
+        LEFT JOIN gifts g ON g.id = d.gift_id
+        WHERE d.day >= ? AND d.day <= ?
+        GROUP BY d.gift_id, g.name
+        ORDER BY SUM(d.redemptions) DESC
+        LIMIT ?
+    """, (*params, top)).fetchall()
+    con.close()
+
+    # الأيام بدون حركة ما إلها صف => نعبيها أصفار حتى الرسم يبقى متصل
+    keys = ("tx_count", "purchase_amount", "points_added", "redemptions", "points_spent")
+    by_day = {_day_str(r["day"]): dict(r) for r in days}
+    start = datetime.strptime(date_from, "%Y-%m-%d").date()
+    end = datetime.strptime(date_to, "%Y-%m-%d").date()
+    days = []
+    while start <= end:
+        day = start.isoformat()
+        days.append(dict(by_day.get(day) or dict.fromkeys(keys, 0), day=day))
+        start += timedelta(days=1)
+    totals = {k: sum(d[k] for d in days) for k in keys}
+    return {
+        "days": days,
+        "totals": totals,
+        "top_techs": [dict(r) for r in top_techs],
+        "by_admin": [dict(r) for r in by_admin],
+        "top_gifts": [dict(r) for r in top_gifts],
+    }
+
+
+# ========= API tokens (تطبيق الموبايل) =========
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_api_token(tech_id, name=""):
+    """يرجع الـ token (يطلع مرة وحدة بس، بالـ DB نخزن الـ hash)."""
+    token = secrets.token_urlsafe(32)
+    con = connect()
+    con.execute(
+        "INSERT INTO api_tokens(tech_id, token_hash, name, created_at) VALUES (?,?,?,?)",
+        (tech_id, _token_hash(token), (name or "")[:100], now())
+    )
+    con.commit()
+    con.close()
+    return token
+
+
+def api_token_tech(token):
+    """tech_id صاحب الـ token، أو None (token غلط/ملغي أو الفني انحذف)."""
+    if not token:
+        return None
+    con = connect()
+    row = con.execute("""
+        SELECT t.id FROM api_tokens a
+        JOIN technicians t ON t.id = a.tech_id
+        WHERE a.token_hash=?
+    """, (_token_hash(token),)).fetchone()
+    con.close()
+    return row["id"] if row else None
+
+
+def revoke_api_token(token):
+    con = connect()
+    con.execute("DELETE FROM api_tokens WHERE token_hash=?", (_token_hash(token),))
+    con.commit()
+    con.close()
+
+
+def revoke_api_tokens(con, tech_id):
+    # بدون commit: مع تغيير كلمة السر / حذف الفني بنفس الـ transaction
+    con.execute("DELETE FROM api_tokens WHERE tech_id=?", (tech_id,))
@@ -0,0 +1,129 @@
+"""
+تصدير CSV للمحاسبة (points_tx و redemptions كاملة أو لفترة/فني):
+الصفوف تنقرا بـ db.stream_query وتنكتب chunk chunk للـ response،
+فالذاكرة ثابتة مهما كبر الـ ledger.
+
+?gzip=1 => ملف .csv.gz (نضغط وإحنا نكتب، بدون ما نجمع الملف).
+"""
+import csv
+import io
+import zlib
+
+import db
+
+# كم حرف نجمع قبل ما نبعث chunk
+CHUNK_CHARS = 64 * 1024
+
+POINTS_COLUMNS = (
+    "id", "created_at", "tech_id", "tech_name", "tech_phone",
+    "purchase_amount", "points_added", "admin_id",
+)
+REDEMPTION_COLUMNS = (
+    "id", "created_at", "tech_id", "tech_name", "tech_phone",
+    "gift_id", "gift_name", "points_spent", "status",
+)
+REDEMPTION_STATUSES = ("pending", "delivered")
+
+# نص يبدي بهذني Excel يحسبه formula (اسم فني "=HYPERLINK(...)" مثلاً)
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _where(alias, since, until, tech_id, status=None):
+    where, params = [], []
+    if tech_id:
+        where.append(f"{alias}.tech_id = ?")
+        params.append(tech_id)
+    if status:
+        where.append(f"{alias}.status = ?")
+        params.append(status)
+    if since is not None:
+        where.append(f"{alias}.created_ts >= ?")
+        params.append(since)
+    if until is not None:
+        where.append(f"{alias}.created_ts < ?")
+        params.append(until)
+    # بفترة => ترتيب زمني على الـ index، بدونها => id (يشمل صفوف ما وصلها الـ backfill)
+    ranged = since is not None or until is not None
+    order = f"{alias}.created_ts, {alias}.id" if ranged else f"{alias}.id"
+    return ("WHERE " + " AND ".join(where)) if where else "", params, order
+
+
+def points_rows(since=None, until=None, tech_id=None, status=None):
+    where_sql, params, order = _where("p", since, until, tech_id)
+    rows = db.stream_query(f"""
+        SELECT p.id, p.created_at, p.tech_id, t.name AS tech_name, t.phone AS tech_phone,
+               p.purchase_amount, p.points_added, p.admin_id
+        FROM points_tx p
+        LEFT JOIN technicians t ON t.id = p.tech_id
+        {where_sql}
+        ORDER BY {order}
+    """, params)
+    return POINTS_COLUMNS, rows
+
+
+def redemption_rows(since=None, until=None, tech_id=None, status=None):
+    where_sql, params, order = _where("r", since, until, tech_id, status)
+    rows = db.stream_query(f"""
+        SELECT r.id, r.created_at, r.tech_id, t.name AS tech_name, t.phone AS tech_phone,
+               r.gift_id, g.name AS gift_name, r.points_spent, r.status
+        FROM redemptions r
+        LEFT JOIN technicians t ON t.id = r.tech_id
+        LEFT JOIN gifts g ON g.id = r.gift_id
+        {where_sql}
+        ORDER BY {order}
+    """, params)
+    return REDEMPTION_COLUMNS, rows
+
+
+# اسم الرابط => (اسم الملف, الدالة)
+EXPORTS = {
+    "points": ("points_tx", points_rows),
+    "redemptions": ("redemptions", redemption_rows),
+}
+
+
+def csv_stream(columns, rows, compress=False):
+    """
+    generator يرجع bytes: BOM (حتى Excel يقرا العربي) + header + الصفوف، كل ~CHUNK_CHARS.
+    compress => gzip stream (نفس صيغة ملف .gz).
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def take():
+        data = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+        return gz.compress(data) if gz else data
+
+    buf.write("\ufeff")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_cell(row[c]) for c in columns])
+        if buf.tell() >= CHUNK_CHARS:
+            chunk = take()
+            if chunk:
+                yield chunk
+
+    tail = take()
+    if gz:
+        tail += gz.flush()
+    if tail:
+        yield tail
+
+
+def _cell(value):
+    # الأسماء والهواتف يكتبها المستخدم: ' قدامها حتى Excel يعرضها نص (CSV injection)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def filename(kind, date_from="", date_to="", tech_id=None, compress=False):
+    parts = [EXPORTS[kind][0]]
+    if tech_id:
+        parts.append(f"tech{tech_id}")
+    if date_from or date_to:
+        parts.append(f"{date_from or 'start'}_{date_to or 'now'}")
+    return "_".join(parts) + (".csv.gz" if compress else ".csv")
@@ -0,0 +1,47 @@
+# gunicorn يقرا هذا الملف تلقائياً من المجلد الحالي (gunicorn app:app)
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+def _bootstrap():
+    # بـ process منفصلة حتى الـ master ما يحمل الـ app (وإلا الـ HUP reload ما يشوف الكود الجديد)
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "bootstrap"], check=True)
+    # الـ workers يورثون الـ env => ما يعيدون الـ bootstrap
+    os.environ["APP_BOOTSTRAPPED"] = "1"
+
+
+def on_starting(server):
+    """migrations + super admin مرة وحدة بالـ master قبل ما تنولد الـ workers."""
+    _bootstrap()
+
+    # metrics: كل worker يكتب ملفاته هنا و /metrics يجمعهم. لازم يبدي فارغ بكل تشغيل
+    path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"prometheus-{os.getpid()}")
+    )
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def on_reload(server):
+    """
+    HUP deploy: الكود الجديد ممكن يجيب migrations جديدة => نعيد الـ bootstrap قبل الـ workers الجديدة
+    (schema حديث = SELECT واحد). إذا فشل ما نوقع الـ master: نشيل APP_BOOTSTRAPPED
+    فكل worker يعيده بأول request، والخطأ يبين هناك بدل ما يشتغل كود جديد على schema قديم.
+    """
+    try:
+        _bootstrap()
+    except subprocess.CalledProcessError:
+        server.log.exception("bootstrap failed on reload")
+        os.environ.pop("APP_BOOTSTRAPPED", None)
+
+
+def child_exit(server, worker):
+    # worker مات (max-requests / crash): الـ gauges مالته تنشال، والـ counters تبقى محسوبة
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
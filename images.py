@@ -0,0 +1,70 @@
+"""
+نسخ مصغرة للصور وقت الرفع (thumb + md) بصيغة WebP + نسخة احتياطية JPEG/PNG.
+صفحات الهدايا تعرض الصورة بـ 72px، فما نحتاج نرسل الأصل للموبايل.
+
+Pillow اختياري: إذا مو منصب نخلي الصورة الأصلية بس.
+"""
+import io
+
+# العرض الأقصى (px) لكل نسخة. thumb = ضعف الـ 72px مال الكروت (شاشات retina)
+VARIANT_SIZES = {
+    "thumb": 144,
+    "md": 480,
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def available():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_variants(fileobj):
+    """
+    يرجع {name: {"width": w, "webp": (bytes, "webp", ctype), "fallback": (bytes, ext, ctype)}}
+    أو {} إذا Pillow مو موجود. يرمي خطأ إذا الملف مو صورة.
+    """
+    if not available():
+        return {}
+
+    from PIL import Image, ImageOps
+
+    fileobj.seek(0)
+    img = Image.open(fileobj)
+    # JPEG: نفك الصورة بدقة أقل مباشرة (1/2..1/8) بدل ما نفك الأصل كامل بالذاكرة
+    # (صورة موبايل 48MP = ~150MB RGB). أكبر نسخة نحتاجها md، فالدقة تكفي
+    largest = max(VARIANT_SIZES.values())
+    img.draft("RGB", (largest, largest))
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if has_alpha else "RGB")
+
+    out = {}
+    for name, size in VARIANT_SIZES.items():
+        v = img.copy()
+        v.thumbnail((size, size), Image.LANCZOS)
+
+        webp = io.BytesIO()
+        v.save(webp, "WEBP", quality=WEBP_QUALITY, method=4)
+
+        fallback = io.BytesIO()
+        if has_alpha:
+            v.save(fallback, "PNG", optimize=True)
+            fb = (fallback.getvalue(), "png", "image/png")
+        else:
+            v.save(fallback, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            fb = (fallback.getvalue(), "jpg", "image/jpeg")
+
+        out[name] = {
+            "width": v.width,
+            "webp": (webp.getvalue(), "webp", "image/webp"),
+            "fallback": fb,
+        }
+
+    fileobj.seek(0)
+    return out
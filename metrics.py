@@ -0,0 +1,145 @@
+"""
+Prometheus metrics على /metrics:
+- http_request_duration_seconds{endpoint,method,status}
+- http_request_db_queries{endpoint} و http_request_db_seconds{endpoint}
+- db_query_duration_seconds{statement}  (الـ SQL بعد db.normalize_sql)
+
+كل response ياخذ Server-Timing (عدد الـ queries + وقت الـ DB)، فتشوفها بالـ DevTools بدون Prometheus.
+أبطأ statement (نص الـ SQL) بس للأدمن، أو للكل إذا SERVER_TIMING_SQL=1 (بيئة تطوير).
+
+gunicorn (أكثر من worker): gunicorn.conf.py يحط PROMETHEUS_MULTIPROC_DIR، كل worker يكتب
+ملفاته هناك و /metrics يجمعهم. الوصول: METRICS_TOKEN (Bearer) أو session أدمن بس
+(ماكو استثناء لـ localhost: ورا nginx على نفس السيرفر كل الطلبات تجي من 127.0.0.1).
+
+prometheus_client اختياري: بدونه Server-Timing يشتغل و /metrics يرجع 501.
+"""
+import functools
+import hmac
+import os
+import time
+
+from flask import Response, g, request, session
+
+import db
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+SERVER_TIMING_SQL = os.getenv("SERVER_TIMING_SQL", "0") == "1"
+
+_REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+_metrics = None
+
+
+def available():
+    try:
+        import prometheus_client  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_metrics():
+    global _metrics
+    if _metrics is None and available():
+        from prometheus_client import Histogram
+        _metrics = {
+            "request": Histogram(
+                "http_request_duration_seconds", "Request latency",
+                ["endpoint", "method", "status"], buckets=_REQUEST_BUCKETS,
+            ),
+            "request_queries": Histogram(
+                "http_request_db_queries", "DB queries per request",
+                ["endpoint"], buckets=_COUNT_BUCKETS,
+            ),
+            "request_db": Histogram(
+                "http_request_db_seconds", "DB time per request",
+                ["endpoint"], buckets=_REQUEST_BUCKETS,
+            ),
+            "query": Histogram(
+                "db_query_duration_seconds", "Latency per normalized SQL statement",
+                ["statement"], buckets=_QUERY_BUCKETS,
+            ),
+        }
+    return _metrics
+
+
+@functools.lru_cache(maxsize=2048)
+def _statement_label(sql):
+    # الـ SQL بالكود ثابت => نفس الـ string يرجع كل مرة، فالـ regex ينعمل مرة وحدة
+    return db.normalize_sql(sql)
+
+
+def _observe_query(sql, seconds):
+    m = _get_metrics()
+    if m is not None:
+        m["query"].labels(_statement_label(sql)).observe(seconds)
+
+
+def _start_timer():
+    g._request_started = time.perf_counter()
+
+
+def _is_admin():
+    return session.get("admin_logged_in") is True
+
+
+def _server_timing(stats):
+    if not stats:
+        return 'db;dur=0;desc="0 queries"'
+    parts = [f'db;dur={stats["seconds"] * 1000:.1f};desc="{stats["count"]} queries"']
+    # نص الـ SQL يكشف الـ schema => مو لأي زائر
+    if stats["slowest_sql"] and (SERVER_TIMING_SQL or _is_admin()):
+        desc = _statement_label(stats["slowest_sql"])[:80].replace('"', "'")
+        parts.append(f'db-slowest;dur={stats["slowest_seconds"] * 1000:.1f};desc="{desc}"')
+    return ", ".join(parts)
+
+
+def _after_request(resp):
+    started = g.pop("_request_started", None)
+    if started is None:
+        return resp
+    stats = db.request_db_stats()
+    resp.headers["Server-Timing"] = _server_timing(stats)
+
+    m = _get_metrics()
+    if m is not None:
+        endpoint = request.endpoint or "unmatched"
+        m["request"].labels(endpoint, request.method, str(resp.status_code)).observe(time.perf_counter() - started)
+        m["request_queries"].labels(endpoint).observe(stats["count"] if stats else 0)
+        m["request_db"].labels(endpoint).observe(stats["seconds"] if stats else 0)
+    return resp
+
+
+def _allowed():
+    if METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        return True
+    return _is_admin()
+
+
+def metrics_view():
+    if not _allowed():
+        return Response("forbidden\n", status=403, mimetype="text/plain")
+    if not available():
+        return Response("prometheus_client غير منصب\n", status=501, mimetype="text/plain")
+
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # نجمع ملفات كل الـ workers (مو بس الـ worker اللي جاه الطلب)
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    if _observe_query not in db._query_observers:
+        db.add_query_observer(_observe_query)
+    app.before_request(_start_timer)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
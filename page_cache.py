@@ -0,0 +1,120 @@
+"""
+كاش للصفحات العامة (/, /winners, /login, /admin/login): نفس الـ HTML لكل زائر مو مسجل دخول،
+فالـ hit يرجع الـ bytes الجاهزة بدون Jinja وبدون DB.
+
+- المفتاح = المسار + الـ query params اللي تفرق بالصفحة (args=...)
+- كل entry إلها TTL، والعدد محدود (LRU)
+- الكتابات تمسح الصفحات المتأثرة: invalidate("winners")
+- الكاش بذاكرة كل process: invalidate يمسح الـ worker الحالي بس، والباقين يلحقون بعد الـ TTL
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, session
+
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE", "1") == "1"
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "30"))
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "256"))
+
+_entries = OrderedDict()  # key -> (expires_at, tags, status, headers, body)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bypass": 0, "evictions": 0, "invalidations": 0}
+
+
+def _anonymous():
+    # مسجل دخول أو عنده flash => الصفحة مو نفسها للكل
+    return not (
+        session.get("admin_logged_in")
+        or session.get("user_logged_in")
+        or "_flashes" in session
+    )
+
+
+def _bump(name, n=1):
+    with _lock:
+        _stats[name] += n
+
+
+def _get(key):
+    with _lock:
+        hit = _entries.get(key)
+        if hit is None:
+            return None
+        if time.monotonic() >= hit[0]:
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return hit
+
+
+def _put(key, entry):
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > PAGE_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def cached_page(ttl=None, tags=(), args=()):
+    """
+    decorator للـ GET views العامة.
+    ttl: ثواني (الافتراضي PAGE_CACHE_TTL)، tags: أسماء نمسح بيها، args: الـ query params اللي تدخل بالمفتاح.
+    """
+    ttl = PAGE_CACHE_TTL if ttl is None else ttl
+    tags = frozenset(tags)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*view_args, **view_kwargs):
+            if not PAGE_CACHE_ENABLED or request.method != "GET" or not _anonymous():
+                _bump("bypass")
+                return view(*view_args, **view_kwargs)
+
+            key = (request.path,) + tuple((a, request.args.get(a, "")) for a in args)
+            hit = _get(key)
+            if hit is not None:
+                _bump("hits")
+                _, _, status, headers, body = hit
+                resp = current_app.response_class(body, status=status, headers=headers)
+                resp.headers["X-Cache"] = "HIT"
+                return resp
+
+            _bump("misses")
+            resp = current_app.make_response(view(*view_args, **view_kwargs))
+            if resp.status_code == 200 and not resp.direct_passthrough and not session.modified:
+                headers = [(k, v) for k, v in resp.headers if k.lower() != "set-cookie"]
+                _put(key, (time.monotonic() + ttl, tags, resp.status_code, headers, resp.get_data()))
+            resp.headers["X-Cache"] = "MISS"
+            return resp
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(*tags):
+    """يمسح كل الصفحات اللي عليها أي tag من هذني (نستدعيها بعد الـ commit)."""
+    tags = set(tags)
+    with _lock:
+        stale = [k for k, v in _entries.items() if v[1] & tags]
+        for k in stale:
+            del _entries[k]
+        _stats["invalidations"] += len(stale)
+
+
+def clear():
+    with _lock:
+        _stats["invalidations"] += len(_entries)
+        _entries.clear()
+
+
+def stats():
+    with _lock:
+        out = dict(_stats, entries=len(_entries))
+    lookups = out["hits"] + out["misses"]
+    out["hit_ratio"] = round(out["hits"] / lookups, 3) if lookups else None
+    return out
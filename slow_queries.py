@@ -0,0 +1,191 @@
+"""
+Slow-query log: أي con.execute ياخذ أكثر من SLOW_QUERY_MS ينكتب سطر JSON بـ logs/slow_queries.log:
+- الـ SQL (literals => ?) والـ params مخفية (النوع والطول بس، بدون أرقام هواتف/باسوردات)
+- منو طلبه: "GET admin_winners /admin/winners" (أو اسم الـ thread برا الـ request)
+- الخطة: EXPLAIN QUERY PLAN (sqlite) / EXPLAIN (FORMAT JSON) (postgres)
+  + full_scans = الجداول اللي تنقرا كاملة (SCAN بدون index / Seq Scan)
+
+الملف يتدور (SLOW_QUERY_LOG_MAX_BYTES × SLOW_QUERY_LOG_BACKUPS)، والكتابة تحت flock
+حتى workers مال gunicorn ما يخربون الدورة على بعض. نفس الـ statement ينعمله EXPLAIN
+مرة كل SLOW_QUERY_EXPLAIN_TTL ثانية بكل process (الخطة ما تتغير كل request).
+
+العرض: /admin/slow-queries
+SLOW_QUERY_MS=0 => يطفيه.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+from flask import has_request_context, request
+
+import db
+
+try:
+    import fcntl
+except ImportError:  # ويندوز: lock داخل الـ process بس
+    fcntl = None
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "logs", "slow_queries.log"
+)
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+SLOW_QUERY_EXPLAIN_TTL = float(os.getenv("SLOW_QUERY_EXPLAIN_TTL", "300"))
+
+_plans = {}  # normalized sql -> (expires_at, plan, full_scans)
+_plans_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+_SQLITE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$")
+
+
+# ========= Redaction =========
+def redact_params(params):
+    """القيم نفسها ما تنكتب بالـ log: int / str(11) / None."""
+    out = []
+    for p in params or ():
+        if p is None:
+            out.append(None)
+        elif isinstance(p, (str, bytes)):
+            out.append(f"{type(p).__name__}({len(p)})")
+        else:
+            out.append(type(p).__name__)
+    return out
+
+
+def _caller():
+    if has_request_context():
+        return f"{request.method} {request.endpoint or '-'} {request.path}"
+    return f"thread:{threading.current_thread().name}"
+
+
+# ========= Plans =========
+def full_scans(plan):
+    """أسماء الجداول اللي الخطة تقراها كاملة."""
+    if plan is None:
+        return []
+    found = []
+    if plan["format"] == "sqlite":
+        for line in plan["plan"]:
+            m = _SQLITE_SCAN_RE.match(line.strip())
+            # "SCAN t USING INDEX ..." يمشي على index (مرتب)، مو قراءة الجدول كله
+            if m and "USING" not in m.group(2):
+                found.append(m.group(1))
+    else:
+        stack = [n.get("Plan", {}) for n in plan["plan"]]
+        while stack:
+            node = stack.pop()
+            if node.get("Node Type") == "Seq Scan":
+                found.append(node.get("Relation Name"))
+            stack.extend(node.get("Plans", ()))
+    return sorted(set(found))
+
+
+def _plan_for(con, sql, params, key):
+    now = time.monotonic()
+    with _plans_lock:
+        hit = _plans.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1], hit[2]
+
+    try:
+        plan = db.explain(con, sql, params)
+    except Exception as e:
+        plan = {"format": "error", "plan": str(e)[:300]}
+    scans = full_scans(plan) if plan and plan["format"] != "error" else []
+    with _plans_lock:
+        _plans[key] = (now + SLOW_QUERY_EXPLAIN_TTL, plan, scans)
+    return plan, scans
+
+
+# ========= Rotating log =========
+def _log_files():
+    return [SLOW_QUERY_LOG] + [f"{SLOW_QUERY_LOG}.{i}" for i in range(1, SLOW_QUERY_LOG_BACKUPS + 1)]
+
+
+def _rotate():
+    files = _log_files()
+    for i in range(len(files) - 1, 0, -1):
+        if os.path.exists(files[i - 1]):
+            os.replace(files[i - 1], files[i])
+
+
+def _append(line):
+    os.makedirs(os.path.dirname(SLOW_QUERY_LOG), exist_ok=True)
+    with _write_lock, open(SLOW_QUERY_LOG + ".lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                size = os.path.getsize(SLOW_QUERY_LOG)
+            except OSError:
+                size = 0
+            if size and size + len(line) > SLOW_QUERY_LOG_MAX_BYTES:
+                _rotate()
+            with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+                f.write(line)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def record(con, sql, params, seconds):
+    """الـ handler اللي db ينادي بعد أي execute بطيء."""
+    key = db.normalize_sql(sql)
+    plan, scans = _plan_for(con, sql, params, key)
+    entry = {
+        "at": db.now(),
+        "ms": round(seconds * 1000, 1),
+        "route": _caller(),
+        "sql": key,
+        "params": redact_params(params),
+        "full_scans": scans,
+        "plan": plan,
+    }
+    try:
+        _append(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError:
+        pass  # الـ log ما لازم يوقع الـ request
+
+
+def recent(limit=200, full_scan_only=False):
+    """آخر الـ entries (الأحدث أول) من الملف الحالي والـ backups."""
+    out = []
+    for path in _log_files():
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in reversed(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if full_scan_only and not entry.get("full_scans"):
+                continue
+            out.append(entry)
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def format_plan(plan):
+    """نص للعرض بالصفحة."""
+    if not plan:
+        return ""
+    if plan["format"] == "sqlite":
+        return "\n".join(plan["plan"])
+    if plan["format"] == "postgres":
+        return json.dumps(plan["plan"], indent=2, ensure_ascii=False)
+    return str(plan["plan"])
+
+
+def init_app(app):
+    if SLOW_QUERY_MS > 0:
+        db.set_slow_query_handler(SLOW_QUERY_MS / 1000, record)
+    app.extensions["slow_queries"] = {"threshold_ms": SLOW_QUERY_MS, "log": SLOW_QUERY_LOG}
+
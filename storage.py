@@ -0,0 +1,194 @@
+"""
+Supabase Storage (REST) client:
+- requests.Session وحدة لكل process (keep-alive بدل TCP/TLS جديد لكل طلب)
+- timeout لكل طلب + retry مع backoff على أخطاء الشبكة و 429/5xx
+- الحذف يروح لجدول storage_jobs، و StorageWorker (thread) ينفذه بالخلفية ويعيد المحاولة إذا فشل.
+  الرفع كله مباشر (الصورة ونسخها المصغرة لازم تكون موجودة قبل ما الـ DB يأشر عليها).
+
+للتجربة بدون Supabase: python -m bench.fake_storage وخلي SUPABASE_URL يأشر عليه.
+"""
+import logging
+import os
+import threading
+
+import db
+
+log = logging.getLogger(__name__)
+
+STORAGE_CONNECT_TIMEOUT = float(os.getenv("STORAGE_CONNECT_TIMEOUT", "5"))
+STORAGE_READ_TIMEOUT = float(os.getenv("STORAGE_READ_TIMEOUT", "30"))
+STORAGE_RETRIES = int(os.getenv("STORAGE_RETRIES", "3"))
+STORAGE_BACKOFF = float(os.getenv("STORAGE_BACKOFF", "0.5"))
+STORAGE_POOL_SIZE = int(os.getenv("STORAGE_POOL_SIZE", "10"))
+
+# الطابور
+STORAGE_JOB_MAX_ATTEMPTS = int(os.getenv("STORAGE_JOB_MAX_ATTEMPTS", "8"))
+STORAGE_WORKER_POLL = float(os.getenv("STORAGE_WORKER_POLL", "5"))
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageClient:
+    def __init__(self, base_url, service_key, bucket):
+        self.base_url = (base_url or "").rstrip("/")
+        self.service_key = service_key
+        self.bucket = bucket
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # بعد fork كل process يسوي session خاصة بيه
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._new_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _new_session(self):
+        # requests/urllib3 ياخذون ~0.1s import => بس إذا فعلاً نحجي ويا Supabase
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=STORAGE_RETRIES,
+            backoff_factor=STORAGE_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            # الرفع عندنا upsert بنفس الاسم (hash)، فإعادته آمنة
+            allowed_methods=frozenset({"GET", "POST", "PUT", "DELETE"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=STORAGE_POOL_SIZE, max_retries=retry)
+        s = requests.Session()
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        s.headers.update({
+            "Authorization": f"Bearer {self.service_key}",
+            "apikey": self.service_key,
+        })
+        return s
+
+    @property
+    def timeout(self):
+        return (STORAGE_CONNECT_TIMEOUT, STORAGE_READ_TIMEOUT)
+
+    def object_url(self, object_path):
+        return f"{self.base_url}/storage/v1/object/{self.bucket}/{object_path}"
+
+    def public_url(self, object_path):
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{object_path}"
+
+    def upload(self, object_path, data, content_type):
+        r = self.session.post(
+            self.object_url(object_path),
+            data=data,
+            headers={"Content-Type": content_type, "x-upsert": "true"},
+            timeout=self.timeout,
+        )
+        if r.status_code not in (200, 201):
+            raise StorageError(f"Supabase upload failed: {r.status_code} {r.text}")
+        return object_path
+
+    def delete(self, object_path):
+        r = self.session.delete(self.object_url(object_path), timeout=self.timeout)
+        if r.status_code in (200, 204, 404):
+            return
+        # Supabase يرجع 400 + not_found إذا الملف أصلاً محذوف
+        if r.status_code == 400 and "not_found" in r.text.replace(" ", "_").lower():
+            return
+        raise StorageError(f"Supabase delete failed: {r.status_code} {r.text}")
+
+    def download(self, object_path):
+        r = self.session.get(self.public_url(object_path), timeout=self.timeout)
+        if r.status_code != 200:
+            raise StorageError(f"Supabase download failed: {r.status_code}")
+        return r.content
+
+
+# ========= الطابور =========
+def enqueue_delete(con, object_path, guard_key=None):
+    """
+    guard_key: إذا نفس الـ hash انرفع من جديد قبل ما يشتغل الـ job، الحذف يتلغى.
+    لازم commit بعدها (نفس transaction مال التغيير بالـ DB)، وبعدها notify().
+    """
+    db.enqueue_storage_job(con, "delete", object_path, guard_key=guard_key)
+
+
+class StorageWorker(threading.Thread):
+    def __init__(self, client):
+        super().__init__(name="storage-worker", daemon=True)
+        self.client = client
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                busy = self.run_once()
+            except Exception:
+                log.exception("storage worker loop failed")
+                busy = False
+            if not busy:
+                self._wake.wait(STORAGE_WORKER_POLL)
+                self._wake.clear()
+
+    def run_once(self):
+        """ينفذ job واحد. يرجع False إذا الطابور فارغ."""
+        job = db.claim_storage_job()
+        if job is None:
+            return False
+
+        try:
+            if job["op"] == "delete":
+                if job["guard_key"] and db.object_refcount(job["guard_key"]) is not None:
+                    # الصورة رجعت تنستخدم => ما نحذف
+                    db.finish_storage_job(job["id"])
+                    return True
+                self.client.delete(job["object_path"])
+            else:
+                raise StorageError(f"unknown storage job op: {job['op']}")
+        except Exception as e:
+            dead = job["attempts"] >= STORAGE_JOB_MAX_ATTEMPTS
+            if dead:
+                log.error("storage job %s (%s %s) gave up: %s", job["id"], job["op"], job["object_path"], e)
+            db.fail_storage_job(job["id"], str(e)[:500], retry_in=min(600, 2 ** job["attempts"]), dead=dead)
+            return True
+
+        db.finish_storage_job(job["id"])
+        return True
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def ensure_worker(client):
+    """يشغل worker واحد لكل process (gunicorn --preload: الـ thread مال الأب ما يعبر الـ fork)."""
+    global _worker
+    if _worker is not None and _worker.pid == os.getpid() and _worker.is_alive():
+        return _worker
+    with _worker_lock:
+        if _worker is None or _worker.pid != os.getpid() or not _worker.is_alive():
+            _worker = StorageWorker(client)
+            _worker.pid = os.getpid()
+            _worker.start()
+    return _worker
+
+
+def notify():
+    # نصحي الـ worker بعد commit حتى ما ينتظر الـ poll
+    w = _worker
+    if w is not None and w.pid == os.getpid():
+        w.wake()